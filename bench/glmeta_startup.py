@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+"""Measure how long a fresh interpreter takes to import glmeta.
+
+Each run is a new process so nothing is cached in memory. The time to
+first use a function lookup and an enum is reported separately since
+glmeta builds those lazily.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+sys.path.insert(0, {build_dir!r})
+start = time.perf_counter()
+import glmeta
+imported = time.perf_counter()
+glmeta.FUNCTIONS_BY_NAME['glDrawArrays']
+looked_up = time.perf_counter()
+glmeta.GL_RGBA
+print(json.dumps([imported - start, looked_up - imported,
+                  time.perf_counter() - looked_up]))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('build_dir', nargs='?', default='build')
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir)
+    child = CHILD.format(root=root, build_dir=os.path.abspath(args.build_dir))
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.check_output([sys.executable, '-c', child])
+        samples.append(json.loads(output))
+
+    for index, label in enumerate(('import glmeta', 'first function lookup',
+                                   'first enum')):
+        times = [sample[index] * 1000 for sample in samples]
+        print('{:22} median {:8.2f} ms  min {:8.2f} ms'.format(
+            label, statistics.median(times), min(times)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+"""Measure function name lookups over the whole registry.
+
+Every function name glmeta knows is looked up in a fixed random order
+with function_id_from_name, which the replayer calls for each function
+ID message, and with the tracer's glXGetProcAddress, which apps call
+for each entry point they use. Reported is the time per lookup.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='report the median of this many runs')
+    parser.add_argument('--rounds', type=int, default=20,
+                        help='times every name is looked up per run')
+    parser.add_argument('build_dir', nargs='?', default='build')
+    args = parser.parse_args()
+    args.build_dir = os.path.abspath(args.build_dir)
+
+    sys.path.append(args.build_dir)
+    import glmeta
+    names = [func.name for func in glmeta.FUNCTIONS]
+    random.Random(0).shuffle(names)
+    stdin = ''.join(name + '\n' for name in names).encode('utf-8')
+
+    function_id = []
+    proc = []
+    for _ in range(args.repeat):
+        output = subprocess.check_output(
+            [os.path.join(args.build_dir, 'pumpkintown_name_lookup_bench'),
+             str(args.rounds)],
+            input=stdin)
+        num_lookups, function_id_seconds, proc_seconds = output.split()
+        function_id.append(float(function_id_seconds) * 1e9 /
+                           int(num_lookups))
+        proc.append(float(proc_seconds) * 1e9 / int(num_lookups))
+
+    print('{} names'.format(len(names)))
+    print('{:22} {:8.1f} ns'.format('function_id_from_name',
+                                    statistics.median(function_id)))
+    print('{:22} {:8.1f} ns'.format('glXGetProcAddress',
+                                    statistics.median(proc)))
+
+
+if __name__ == '__main__':
+    main()
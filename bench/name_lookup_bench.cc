@@ -0,0 +1,76 @@
+// Times the name lookups done when an app resolves its GL entry points
+// and when the replayer reads function ID messages. Run by
+// bench/name_lookup.py.
+//
+//   pumpkintown_name_lookup_bench ROUNDS < NAMES
+//
+// Looks up every name on stdin ROUNDS times with function_id_from_name
+// and with the tracer's glXGetProcAddress, and prints the number of
+// lookups and the seconds each took.
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <iostream>
+#include <string>
+#include <vector>
+
+#include "pumpkintown_function_id.hh"
+
+extern "C" void* glXGetProcAddress(const char* name);
+
+namespace pumpkintown {
+
+namespace {
+
+template<typename Fn>
+double time_lookups(const std::vector<std::string>& names, const int rounds,
+                    const Fn& lookup) {
+  int misses{0};
+  const auto start = std::chrono::steady_clock::now();
+  for (int round{0}; round < rounds; round++) {
+    for (const auto& name : names) {
+      if (!lookup(name)) {
+        misses++;
+      }
+    }
+  }
+  const std::chrono::duration<double> elapsed{
+    std::chrono::steady_clock::now() - start};
+  if (misses) {
+    fprintf(stderr, "%d lookups failed\n", misses);
+    exit(1);
+  }
+  return elapsed.count();
+}
+
+}
+
+}
+
+int main(int argc, char** argv) {
+  if (argc != 2) {
+    fprintf(stderr, "usage: pumpkintown_name_lookup_bench ROUNDS < NAMES\n");
+    return 1;
+  }
+  const int rounds{atoi(argv[1])};
+
+  std::vector<std::string> names;
+  std::string name;
+  while (std::getline(std::cin, name)) {
+    names.push_back(name);
+  }
+
+  const double function_id_seconds{pumpkintown::time_lookups(
+      names, rounds, [](const std::string& name) {
+        return pumpkintown::function_id_from_name(name) !=
+            pumpkintown::FunctionId::Invalid;
+      })};
+  const double proc_seconds{pumpkintown::time_lookups(
+      names, rounds, [](const std::string& name) {
+        return glXGetProcAddress(name.c_str()) != nullptr;
+      })};
+  printf("%zu %f %f\n", names.size() * rounds, function_id_seconds,
+         proc_seconds);
+  return 0;
+}
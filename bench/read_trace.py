@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""Measure how fast TraceReader decodes a trace."""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pumpkinpy.trace_reader import TraceReader
+
+
+def time_pass(path, use_mmap, numpy_arrays):
+    reader = TraceReader(path, use_mmap=use_mmap, numpy_arrays=numpy_arrays)
+    num_calls = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            reader.read()
+            num_calls += 1
+    except StopIteration:
+        pass
+    elapsed = time.perf_counter() - start
+    reader.close()
+    return num_calls, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='report the best of this many passes')
+    parser.add_argument('--numpy-arrays', action='store_true',
+                        help='decode array params into NumPy arrays')
+    parser.add_argument('trace')
+    args = parser.parse_args()
+
+    num_bytes = os.path.getsize(args.trace)
+    for use_mmap in (False, True):
+        best = None
+        for _ in range(args.repeat):
+            num_calls, elapsed = time_pass(args.trace, use_mmap,
+                                           args.numpy_arrays)
+            if best is None or elapsed < best:
+                best = elapsed
+        print('{:5} {} calls in {:.3f}s: {:.0f} calls/s, {:.1f} MB/s'.format(
+            'mmap' if use_mmap else 'file', num_calls, best,
+            num_calls / best, num_bytes / best / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+// Stand-in for libGL and libEGL whose functions do nothing, for
+// measuring the tracer without a GPU.
+//
+// The functions pumpkintown_tracer_bench calls are exported, so with
+// the tracer preloaded the bench's calls reach the tracer's wrappers
+// by symbol interposition, as an application's would. The tracer looks
+// up the real functions through glXGetProcAddress or
+// eglGetProcAddress, where every name resolves to the same no-op. The
+// exported functions can't be returned there: the tracer's symbols
+// take precedence over them even inside this library.
+
+#include "stub_gl.hh"
+
+namespace {
+
+long noop() {
+  return 1;
+}
+
+}
+
+extern "C" {
+
+void* glXGetProcAddress(const char* name) {
+  return reinterpret_cast<void*>(&noop);
+}
+
+void* glXGetProcAddressARB(const char* name) {
+  return reinterpret_cast<void*>(&noop);
+}
+
+void* eglGetProcAddress(const char* name) {
+  return reinterpret_cast<void*>(&noop);
+}
+
+void glBindTexture(GLenum target, GLuint texture) {}
+
+void glBufferData(GLenum target, GLsizeiptr size, const void* data,
+                  GLenum usage) {}
+
+void glDrawArrays(GLenum mode, GLint first, GLsizei count) {}
+
+void glTexImage2D(GLenum target, GLint level, GLint internalformat,
+                  GLsizei width, GLsizei height, GLint border, GLenum format,
+                  GLenum type, const void* pixels) {}
+
+void glUniform4fv(GLint location, GLsizei count, const GLfloat* value) {}
+
+void glUniformMatrix4fv(GLint location, GLsizei count, GLboolean transpose,
+                        const GLfloat* value) {}
+
+void glXSwapBuffers(Display* dpy, GLXDrawable drawable) {}
+
+EGLBoolean eglSwapBuffers(EGLDisplay dpy, EGLSurface surface) {
+  return true;
+}
+
+}
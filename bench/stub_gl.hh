@@ -0,0 +1,30 @@
+// The functions bench/stub_gl.cc exports, which pumpkintown_tracer_bench
+// calls directly like an application linked against libGL.
+
+#ifndef PUMPKINTOWN_BENCH_STUB_GL_HH_
+#define PUMPKINTOWN_BENCH_STUB_GL_HH_
+
+#include "pumpkintown_gl_types.hh"
+
+extern "C" {
+
+void* glXGetProcAddress(const char* name);
+void* glXGetProcAddressARB(const char* name);
+void* eglGetProcAddress(const char* name);
+
+void glBindTexture(GLenum target, GLuint texture);
+void glBufferData(GLenum target, GLsizeiptr size, const void* data,
+                  GLenum usage);
+void glDrawArrays(GLenum mode, GLint first, GLsizei count);
+void glTexImage2D(GLenum target, GLint level, GLint internalformat,
+                  GLsizei width, GLsizei height, GLint border, GLenum format,
+                  GLenum type, const void* pixels);
+void glUniform4fv(GLint location, GLsizei count, const GLfloat* value);
+void glUniformMatrix4fv(GLint location, GLsizei count, GLboolean transpose,
+                        const GLfloat* value);
+void glXSwapBuffers(Display* dpy, GLXDrawable drawable);
+EGLBoolean eglSwapBuffers(EGLDisplay dpy, EGLSurface surface);
+
+}
+
+#endif  // PUMPKINTOWN_BENCH_STUB_GL_HH_
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""Write a synthetic binary trace for benchmarking the Python tools.
+
+Each frame re-binds a program and texture, uploads a texture and a
+vertex buffer, then issues a batch of uniform updates and draws.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pumpkinpy.trace_writer import TraceWriter
+
+GL_ARRAY_BUFFER = 0x8892
+GL_RGBA = 0x1908
+GL_STATIC_DRAW = 0x88e4
+GL_TEXTURE_2D = 0x0de1
+GL_TRIANGLES = 0x0004
+GL_UNSIGNED_BYTE = 0x1401
+GL_VERTEX_SHADER = 0x8b31
+
+
+def write_trace(args):
+    writer = TraceWriter(args.output)
+    writer.write_call('glXCreateNewContext', return_value=0x1000)
+    writer.write_call('glXMakeContextCurrent', ctx=0x1000)
+    writer.write_call('glGenTextures', n=1, textures=[1])
+    writer.write_call('glGenBuffers', n=1, buffers=[1])
+    writer.write_call('glCreateShader', type=GL_VERTEX_SHADER, return_value=1)
+    writer.write_call('glShaderSource', shader=1,
+                      source='void main() { gl_Position = vec4(0); }')
+    writer.write_call('glCompileShader', shader=1)
+    writer.write_call('glCreateProgram', return_value=2)
+    writer.write_call('glAttachShader', program=2, shader=1)
+    writer.write_call('glLinkProgram', program=2)
+
+    size = args.texture_size
+    matrix = [float(i) for i in range(16)]
+    for frame in range(args.frames):
+        writer.write_call('glUseProgram', program=2)
+        writer.write_call('glBindTexture', target=GL_TEXTURE_2D, texture=1)
+        if args.unique_uploads:
+            pixels = frame.to_bytes(4, 'little') * (size * size)
+        else:
+            pixels = bytes(size * size * 4)
+        writer.write_call('glTexImage2D', target=GL_TEXTURE_2D,
+                          internalformat=GL_RGBA, width=size, height=size,
+                          format=GL_RGBA, type=GL_UNSIGNED_BYTE,
+                          pixels=pixels)
+        writer.write_call('glBindBuffer', target=GL_ARRAY_BUFFER, buffer=1)
+        writer.write_call('glBufferData', target=GL_ARRAY_BUFFER,
+                          size=args.buffer_size,
+                          data=bytes(args.buffer_size),
+                          usage=GL_STATIC_DRAW)
+        for draw in range(args.draws):
+            writer.write_call('glBindTexture', target=GL_TEXTURE_2D,
+                              texture=1)
+            writer.write_call('glUniformMatrix4fv', location=draw, count=1,
+                              value=matrix)
+            writer.write_call('glUniform4fv', location=draw, count=1,
+                              value=[1.0, 0.5, 0.25, 1.0])
+            writer.write_call('glDrawArrays', mode=GL_TRIANGLES, first=0,
+                              count=3)
+        writer.write_call('glGetError', return_value=0)
+        writer.write_call('glXSwapBuffers')
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--draws', type=int, default=20,
+                        help='draw calls per frame')
+    parser.add_argument('--texture-size', type=int, default=64)
+    parser.add_argument('--buffer-size', type=int, default=4096)
+    parser.add_argument('--unique-uploads', action='store_true',
+                        help='make every texture upload different')
+    parser.add_argument('output')
+    args = parser.parse_args()
+    write_trace(args)
+
+
+if __name__ == '__main__':
+    main()
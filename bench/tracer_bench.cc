@@ -0,0 +1,112 @@
+// Drives a mix of GL calls so the tracer's cost can be measured against
+// the no-op GL of stub_gl.cc. The functions are called directly, like
+// from an application linked against libGL, so with the tracer
+// preloaded they go to its wrappers. Run by bench/tracer_overhead.py,
+// which preloads the tracer or not.
+//
+//   pumpkintown_tracer_bench MIX FRAMES THREADS
+//
+// Prints the number of calls made and the seconds they took.
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <stdexcept>
+#include <string>
+#include <thread>
+#include <vector>
+
+#include "pumpkintown_gl_enum.hh"
+#include "stub_gl.hh"
+
+namespace pumpkintown {
+
+namespace {
+
+constexpr int kDrawsPerFrame{200};
+constexpr int kUploadDrawsPerFrame{10};
+constexpr int kTextureSize{256};
+constexpr int kBufferSize{1024 * 1024};
+
+// Binds, uniform updates and draws, the usual hot loop. Returns the
+// number of calls made.
+uint64_t draw_frame(const int num_draws) {
+  static const GLfloat matrix[16]{1, 0, 0, 0, 0, 1, 0, 0,
+                                  0, 0, 1, 0, 0, 0, 0, 1};
+  static const GLfloat color[4]{1, 0.5, 0.25, 1};
+  for (int draw{0}; draw < num_draws; draw++) {
+    glBindTexture(GL_TEXTURE_2D, draw % 8 + 1);
+    glUniformMatrix4fv(0, 1, false, matrix);
+    glUniform4fv(1, 1, color);
+    glDrawArrays(GL_TRIANGLES, 0, 3);
+  }
+  glXSwapBuffers(nullptr, nullptr);
+  return num_draws * 4 + 1;
+}
+
+// A texture and a buffer upload per frame plus a few draws
+uint64_t upload_frame(const std::vector<uint8_t>& pixels,
+                      const std::vector<uint8_t>& vertices) {
+  glBindTexture(GL_TEXTURE_2D, 1);
+  glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, kTextureSize, kTextureSize, 0,
+               GL_RGBA, GL_UNSIGNED_BYTE, pixels.data());
+  glBufferData(GL_ARRAY_BUFFER, vertices.size(), vertices.data(),
+               GL_STATIC_DRAW);
+  return 3 + draw_frame(kUploadDrawsPerFrame);
+}
+
+uint64_t run(const std::string& mix, const int num_frames) {
+  uint64_t num_calls{0};
+  if (mix == "draw") {
+    for (int frame{0}; frame < num_frames; frame++) {
+      num_calls += draw_frame(kDrawsPerFrame);
+    }
+  } else if (mix == "upload") {
+    std::vector<uint8_t> pixels(kTextureSize * kTextureSize * 4);
+    std::vector<uint8_t> vertices(kBufferSize);
+    for (int frame{0}; frame < num_frames; frame++) {
+      // Different contents every frame, like streamed data
+      memset(pixels.data(), frame, pixels.size());
+      num_calls += upload_frame(pixels, vertices);
+    }
+  } else {
+    throw std::runtime_error("unknown mix: " + mix);
+  }
+  return num_calls;
+}
+
+}
+
+}
+
+int main(int argc, char** argv) {
+  if (argc != 4) {
+    fprintf(stderr, "usage: %s draw|upload FRAMES THREADS\n", argv[0]);
+    return 1;
+  }
+  const std::string mix{argv[1]};
+  const int num_frames{atoi(argv[2])};
+  const int num_threads{atoi(argv[3])};
+
+  std::vector<uint64_t> num_calls(num_threads);
+  const auto start = std::chrono::steady_clock::now();
+  std::vector<std::thread> threads;
+  for (int i{0}; i < num_threads; i++) {
+    threads.emplace_back([&, i] {
+      num_calls[i] = pumpkintown::run(mix, num_frames);
+    });
+  }
+  for (auto& thread : threads) {
+    thread.join();
+  }
+  const std::chrono::duration<double> elapsed{
+    std::chrono::steady_clock::now() - start};
+
+  uint64_t total{0};
+  for (const auto count : num_calls) {
+    total += count;
+  }
+  printf("%lu %.6f\n", static_cast<unsigned long>(total), elapsed.count());
+  return 0;
+}
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+"""Measure how much the tracer slows down GL calls.
+
+pumpkintown_tracer_bench is run against the no-op GL from
+bench/stub_gl.cc, once as is and once with libpumpkintown.so preloaded,
+for each call mix:
+
+    draw      binds, uniforms and draws, 801 calls per frame
+    upload    a 256 KiB texture and a 1 MiB buffer per frame
+    threads   the draw mix on several threads at once
+
+Reported are the time per call with and without the tracer, the
+difference, and how fast the trace was written. The write rate is over
+the whole traced process, so it includes the final flush.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Mix name -> (tracer_bench mix, frames, whether to use --threads)
+MIXES = {
+    'draw': ('draw', 2000, False),
+    'upload': ('upload', 200, False),
+    'threads': ('draw', 500, True),
+}
+
+
+def run(args, mix, traced):
+    bench_mix, frames, threaded = MIXES[mix]
+    frames = int(frames * args.scale)
+    threads = args.threads if threaded else 1
+    env = dict(os.environ)
+    env['LD_LIBRARY_PATH'] = os.path.join(args.build_dir, 'bench')
+    if traced:
+        env['LD_PRELOAD'] = os.path.join(args.build_dir,
+                                         'libpumpkintown.so')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        output = subprocess.check_output(
+            [os.path.join(args.build_dir, 'pumpkintown_tracer_bench'),
+             bench_mix, str(frames), str(threads)],
+            cwd=tmp_dir, env=env)
+        wall = time.perf_counter() - start
+        trace_path = os.path.join(tmp_dir, 'trace')
+        num_bytes = os.path.getsize(trace_path) if traced else 0
+    num_calls, elapsed = output.split()
+    return int(num_calls), float(elapsed), num_bytes, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='report the median of this many runs')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='threads in the threads mix')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiply the number of frames')
+    parser.add_argument('--mix', action='append', choices=sorted(MIXES),
+                        help='mixes to run, all by default')
+    parser.add_argument('build_dir', nargs='?', default='build')
+    args = parser.parse_args()
+    args.build_dir = os.path.abspath(args.build_dir)
+
+    print('{:8} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'mix', 'calls', 'base ns', 'traced ns', 'overhead', 'MB/s'))
+    for mix in args.mix or MIXES:
+        base = []
+        traced = []
+        rates = []
+        for _ in range(args.repeat):
+            num_calls, elapsed, _, _ = run(args, mix, False)
+            base.append(elapsed * 1e9 / num_calls)
+            num_calls, elapsed, num_bytes, wall = run(args, mix, True)
+            traced.append(elapsed * 1e9 / num_calls)
+            rates.append(num_bytes / wall / 1e6)
+        base_ns = statistics.median(base)
+        traced_ns = statistics.median(traced)
+        print('{:8} {:10} {:10.1f} {:10.1f} {:10.1f} {:10.1f}'.format(
+            mix, num_calls, base_ns, traced_ns, traced_ns - base_ns,
+            statistics.median(rates)))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
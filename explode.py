@@ -1,19 +1,42 @@
 #!/usr/bin/env python3
 
 import argparse
+import contextlib
+import hashlib
 import os
+import struct
 import sys
 
 import PIL.Image
 import attr
 
 from pumpkinpy import trace_reader
-from pumpkinpy.types import Source
+from pumpkinpy.blobs import BlobArchive, BlobWriter
+from pumpkinpy.decoder import is_byte_array, py_struct_type
+from pumpkinpy.types import StreamingSource
 
 # TODO
 sys.path.append('build')
 import glmeta
 
+# Handler name -> Exploder method, see handler()
+HANDLERS = {}
+
+
+def handler(name):
+    """Register an Exploder method as the explode handler called name.
+
+    Functions are mapped to handlers by the "explode" entry in
+    overrides.json, or with Exploder.register.
+    """
+    def register(method):
+        if name in HANDLERS:
+            raise KeyError('duplicate explode handler: ' + name)
+        HANDLERS[name] = method
+        return method
+    return register
+
+
 @attr.s
 class Resources:
     programs = attr.ib(factory=dict)
@@ -26,18 +49,41 @@ class Resources:
 class Context:
     var = attr.ib()
     res = attr.ib()
+    # Bound objects as of the last emitted call, see
+    # Exploder.is_redundant_bind. Missing keys are unknown.
+    bindings = attr.ib(factory=lambda: {'active_texture': glmeta.GL_TEXTURE0})
 
 
 class Exploder:
     def __init__(self, args):
         self.output = args.output
-        self.reader = trace_reader.TraceReader(args.trace)
-        self.src = Source()
+        self.reader = trace_reader.TraceReader(
+            args.trace, use_mmap=args.mmap, numpy_arrays=args.numpy_arrays)
+        self.blobs = BlobWriter(args.write_jobs,
+                                args.write_budget * 1024 * 1024)
+        self.archive = None
+        if args.pack:
+            self.archive = BlobArchive(self.output)
+        self.src = StreamingSource(os.path.join(self.output, 'trace'))
         self.context_map = {}
         self.next_id = 0
         self.ctx = None
         self.call_index = 0
         self.enable_png_texture_dump = args.png_textures
+        self.binary_array_threshold = args.binary_array_threshold
+        self.remove_redundant_binds = args.remove_redundant_binds
+        self.num_removed_calls = 0
+        # Function ID -> bound handler method
+        self.dispatch = {}
+        # Function name -> handler name, overriding overrides.json
+        self.handler_names = {}
+        self.dedup = not args.no_dedup
+        # (extension, payload hash) -> reference to the stored blob
+        self.saved_blobs = {}
+        self.num_blobs = 0
+        self.num_stored_blobs = 0
+        self.blob_bytes = 0
+        self.saved_bytes = 0
 
     def take_id(self):
         nid = self.next_id
@@ -78,17 +124,43 @@ class Exploder:
             img.save(wfile)
 
     def save_raw(self, prefix, index, data):
+        """Store a payload and return the trace's reference to it.
+
+        The reference is "file:NAME" for a file in the output directory
+        or "pack:INDEX" for a blob in the archive, and None if there is
+        no data.
+        """
         if not data:
             return
         ext = 'raw'
         if prefix == 'shader':
             ext = 'txt'
-        name = '{}_{:04}.{}'.format(prefix, index, ext)
-        path = os.path.join(self.output, name)
-        with open(path, 'wb') as wfile:
-            wfile.write(data)
-        return name
-
+        self.num_blobs += 1
+        self.blob_bytes += len(data)
+        if self.dedup:
+            key = (ext, hashlib.blake2b(data, digest_size=16).digest())
+            ref = self.saved_blobs.get(key)
+            if ref is not None:
+                self.saved_bytes += len(data)
+                return ref
+        if self.archive:
+            ref = 'pack:{}'.format(self.archive.add(data))
+        else:
+            name = '{}_{:04}.{}'.format(prefix, index, ext)
+            self.blobs.write(os.path.join(self.output, name), data)
+            ref = f'file:{name}'
+        if self.dedup:
+            self.saved_blobs[key] = ref
+        self.num_stored_blobs += 1
+        return ref
+
+    def print_blob_summary(self):
+        print('{} payloads, {} bytes; stored {} blobs, {} bytes; '
+              'deduplication saved {} bytes'.format(
+                  self.num_blobs, self.blob_bytes, self.num_stored_blobs,
+                  self.blob_bytes - self.saved_bytes, self.saved_bytes))
+
+    @handler('create_context')
     def create_context(self, call):
         var = f'ctx{self.take_id()}'
         orig_share_ctx = call.fields.get('share_context')
@@ -101,6 +173,7 @@ class Exploder:
         self.src.add(f'context_create {share_ctx} -> {var}')
         self.context_map[call.fields['return_value']] = Context(var, res)
 
+    @handler('make_context_current')
     def make_context_current(self, call):
         orig_ctx = call.fields['ctx']
         if orig_ctx == 0:
@@ -111,56 +184,70 @@ class Exploder:
             self.ctx = self.context_map[orig_ctx]
         self.src.add(f'make_current {context}')
 
+    @handler('standard_gen')
     def standard_gen(self, call):
         count = call.fields['n']
         var = f'id{self.take_id()}'
         self.src.add(f'{call.func.name} {count} {var}')
 
+    @handler('standard_delete')
     def standard_delete(self, call):
         # TODO
         pass
 
+    @handler('buffer_data')
     def buffer_data(self, call):
         index = self.take_id()
-        save_name = self.save_raw('buf', index, call.fields['data'])
+        data = self.save_raw('buf', index, call.fields['data']) or 'null'
         target = hex(call.fields['target'])
         size = call.fields['size']
-        data = f'file:{save_name}'
         usage = hex(call.fields['usage'])
         self.src.add(f'glBufferData {target} {size} {data} {usage}')
 
+    @handler('tex_image')
     def tex_image(self, call):
         index = self.take_id()
-        save_name = self.save_raw('tex', index, call.fields['pixels'])
+        pixels = self.save_raw('tex', index, call.fields['pixels'])
         args = []
         for param in call.func.params:
             if param.name == 'pixels':
                 if call.fields['pixels_length'] == 0:
                     args.append('null')
                 else:
-                    args.append(f'file:{save_name}')
+                    args.append(pixels)
             else:
                 args.append(hex(call.fields[param.name]))
         args = ' '.join(args)
         self.src.add(f'{call.func.name} {args}')
 
+    @handler('shader_source')
     def shader_source(self, call):
         index = self.take_id()
-        save_path = self.save_raw('shader', index,
-                                  call.fields['source'].encode('utf-8'))
+        source = self.save_raw('shader', index,
+                               call.fields['source'].encode('utf-8'))
         shader = call.fields['shader']
         shader = self.ctx.res.shaders[shader]
-        self.src.add(f'glShaderSource {shader} file:{save_path}')
+        self.src.add(f'glShaderSource {shader} {source}')
 
+    @handler('program_binary')
     def program_binary(self, call):
         index = self.take_id()
-        save_path = self.save_raw('program', index, call.fields['binary'])
-        self.src.add(f'const auto vec = read_all("{save_path}");')
+        binary = self.save_raw('program', index, call.fields['binary'])
+        if binary is None:
+            # Empty binary
+            data = 'nullptr'
+        elif binary.startswith('pack:'):
+            data = 'packed_blob({})'.format(binary[len('pack:'):])
+        else:
+            path = binary[len('file:'):]
+            self.src.add(f'const auto vec = read_all("{path}");')
+            data = 'vec.data()'
         fmt = call.fields['binaryFormat']
         length = call.fields['length']
         program = self.ctx.res.programs[call.fields['program']]
-        self.src.add(f'glProgramBinary({program}, {fmt}, vec.data(), {length});')
+        self.src.add(f'glProgramBinary({program}, {fmt}, {data}, {length});')
 
+    @handler('standard_create')
     def standard_create(self, call):
         prefix = 'glCreate'
         name = call.func.name[len(prefix):].lower()
@@ -172,6 +259,7 @@ class Exploder:
         self.src.add(f'{call.func.name} {args} -> {var}')
         self.ctx.res[name][call.return_value] = var
 
+    @handler('use_program')
     def use_program(self, call):
         program = call.fields['program']
         if program != 0:
@@ -191,82 +279,178 @@ class Exploder:
                 shader = self.ctx.res.shaders[shader]
             self.src.add(f'  check_shader_compile({shader});')
 
+    def is_redundant_bind(self, call):
+        """Check if a call only binds what is already bound.
+
+        The bindings of the current context are updated for calls that
+        aren't redundant. Calls that change bindings in ways that
+        aren't tracked make them unknown again.
+        """
+        name = call.func.name
+        fields = call.fields
+        if name.startswith('glDelete'):
+            # Deleting a bound object unbinds it, and its name can be
+            # reused. Forget everything rather than track that.
+            for context in self.context_map.values():
+                context.bindings.clear()
+            return False
+        if self.ctx is None:
+            return False
+
+        bindings = self.ctx.bindings
+        if name == 'glActiveTexture':
+            changes = {'active_texture': fields['texture']}
+        elif name == 'glBindTexture':
+            unit = bindings.get('active_texture')
+            changes = {('texture', unit, fields['target']): fields['texture']}
+        elif name == 'glUseProgram':
+            changes = {'program': fields['program']}
+        elif name == 'glBindBuffer':
+            changes = {('buffer', fields['target']): fields['buffer']}
+        elif name == 'glBindFramebuffer':
+            target = fields['target']
+            if target == glmeta.GL_FRAMEBUFFER:
+                targets = (glmeta.GL_DRAW_FRAMEBUFFER,
+                           glmeta.GL_READ_FRAMEBUFFER)
+            else:
+                targets = (target,)
+            changes = {('framebuffer', target): fields['framebuffer']
+                       for target in targets}
+        elif name == 'glBindVertexArray':
+            changes = {'vertex_array': fields['array']}
+            if bindings.get('vertex_array') != fields['array']:
+                # The element array binding belongs to the VAO
+                bindings.pop(('buffer', glmeta.GL_ELEMENT_ARRAY_BUFFER),
+                             None)
+        elif name.startswith(('glBind', 'glPop')):
+            # glBindBufferBase, glBindTextures, glPopAttrib and so on
+            bindings.clear()
+            bindings['active_texture'] = None
+            return False
+        else:
+            return False
+
+        if all(key in bindings and bindings[key] == value
+               for key, value in changes.items()):
+            return True
+        bindings.update(changes)
+        return False
+
+    def handler_for(self, func):
+        """Look up the handler of a function.
+
+        The handler is named by the function's "explode" entry in
+        overrides.json, functions without one use generic_call.
+        """
+        name = self.handler_names.get(func.name, func.explode)
+        if name is None:
+            return self.generic_call
+        return HANDLERS[name].__get__(self)
+
+    def register(self, function_name, handler_name):
+        """Handle calls to a function with a registered handler.
+
+        This overrides the "explode" entry in overrides.json.
+        """
+        if handler_name not in HANDLERS:
+            raise KeyError('unknown explode handler: ' + handler_name)
+        self.handler_names[function_name] = handler_name
+        self.dispatch.clear()
+
+    @handler('ignore')
+    def ignore(self, call):
+        # TODO
+        pass
+
+    def generic_call(self, call):
+        args = []
+        for param in call.func.params:
+            field = call.fields[param.name]
+            if param.resource:
+                if field == 0:
+                    args.append(0)
+                else:
+                    args.append(self.ctx.res[param.resource][field])
+            elif param.array:
+                index = self.take_id()
+                arr = f'arr{index}'
+                length = call.fields[f'{param.name}_length']
+                if (self.binary_array_threshold is not None and length and
+                        length >= self.binary_array_threshold):
+                    values = self.save_raw(
+                        'arr', index, array_bytes(param, field))
+                else:
+                    if hasattr(field, 'tolist'):
+                        # NumPy scalars print float32s rounded, Python
+                        # floats print them in full like the list path
+                        field = field.tolist()
+                    values = ' '.join(str(elem) for elem in field)
+                self.src.add(f'array {arr} {param.array} {values}')
+                args.append(arr)
+            elif param.offset:
+                args.append(str(field))
+            elif isinstance(field, float):
+                args.append(str(field))
+            else:
+                args.append(hex(field))
+        args = ' '.join(args)
+        self.src.add(f'{call.func.name} {args}')
+
     def handle_call(self, call):
         name = call.func.name
         #self.src.add(f'  fprintf(stderr, "{self.call_index} {name}\\n");')
 
+        if self.remove_redundant_binds and self.is_redundant_bind(call):
+            self.num_removed_calls += 1
+            self.call_index += 1
+            return
+
         if self.enable_png_texture_dump and name in ('glTexSubImage2D', 'glTexImage2D'):
             self.save_texture_png(call)
 
-        if name in ('glXCreateNewContext', 'glXCreateContextAttribsARB',
-                    'eglCreateContext'):
-            self.create_context(call)
-        elif name in ('glXMakeContextCurrent', 'eglMakeCurrent'):
-            self.make_context_current(call)
-        elif name in ('glGenBuffers', 'glGenTextures',
-                      'glGenFramebuffers', 'glGenVertexArrays',
-                      'glGenRenderbuffers'):
-            self.standard_gen(call)
-        elif name in ('glDeleteTextures',):
-            self.standard_delete(call)
-        elif name in ('glCreateProgram', 'glCreateShader'):
-            self.standard_create(call)
-        elif name == 'glUseProgram':
-            self.use_program(call)
-        elif name in ('glTexImage2D', 'glTexSubImage2D'):
-            self.tex_image(call)
-        elif name == 'glBufferData':
-            self.buffer_data(call)
-        elif name == 'glShaderSource':
-            self.shader_source(call)
-        elif name == 'glProgramBinary':
-            self.program_binary(call)
-        elif name in ('glXWaitGL', 'glXWaitX',
-                      'glXSwapIntervalMESA',
-                      'eglGetCurrentContext',
-                      'eglGetCurrentSurface'):
-            # TODO
-            pass
-        else:
-            args = []
-            for param in call.func.params:
-                field = call.fields[param.name]
-                if param.resource:
-                    if field == 0:
-                        args.append(0)
-                    else:
-                        args.append(self.ctx.res[param.resource][field])
-                elif param.array:
-                    arr = f'arr{self.take_id()}'
-                    length = call.fields[f'{param.name}_length']
-                    values = ' '.join(str(elem) for elem in field)
-                    self.src.add(f'array {arr} {param.array} {values}')
-                    args.append(arr)
-                elif param.offset:
-                    args.append(str(field))
-                elif isinstance(field, float):
-                    args.append(str(field))
-                else:
-                    args.append(hex(field))
-            args = ' '.join(args)
-            self.src.add(f'{name} {args}')
+        handler = self.dispatch.get(call.func.function_id)
+        if handler is None:
+            handler = self.handler_for(call.func)
+            self.dispatch[call.func.function_id] = handler
+        handler(call)
         #self.check_gl_errors(call)
         # if name == 'glDrawElements' and self.call_index > 25000:
         #     self.src.add(f'  capture("fbo{self.call_index}.png");')
         self.call_index += 1
 
     def explode(self):
-        try:
-            while True:
-                call = self.reader.read()
-                if call:
-                    self.handle_call(call)
-        except StopIteration:
-            pass
-
-        path = os.path.join(self.output, 'trace')
-        with open(path, 'w') as wfile:
-            wfile.write(self.src.text())
+        with contextlib.ExitStack() as stack:
+            # Closed in reverse order, every close runs even if an
+            # earlier one raises
+            stack.callback(self.reader.close)
+            if self.archive:
+                stack.callback(self.archive.close)
+            # Blobs can be views of the reader's mapping
+            stack.callback(self.blobs.close)
+            stack.callback(self.src.close)
+            try:
+                while True:
+                    try:
+                        call = self.reader.read()
+                    except StopIteration:
+                        break
+                    if call:
+                        self.handle_call(call)
+            except BaseException:
+                print('stopped at call {}, {} is incomplete'.format(
+                    self.call_index, self.src.path), file=sys.stderr)
+                raise
+
+
+def array_bytes(param, values):
+    """Little-endian binary form of a decoded array param."""
+    if is_byte_array(param.array):
+        return bytes(values)
+    if hasattr(values, 'tobytes'):
+        # NumPy array, already little-endian
+        return values.tobytes()
+    return struct.pack('<{}{}'.format(len(values),
+                                      py_struct_type(param.array)), *values)
 
 
 def create_template_link(args, name):
@@ -280,12 +464,38 @@ def create_template_link(args, name):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--png-textures', action='store_true')
+    parser.add_argument('--mmap', action='store_true',
+                        help='memory-map the trace instead of reading it')
+    parser.add_argument('--numpy-arrays', action='store_true',
+                        help='decode array params into NumPy arrays')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='write every payload to its own file, even '
+                        'if an identical one was written before')
+    parser.add_argument('--pack', action='store_true',
+                        help='store payloads in one archive file instead '
+                        'of a file each')
+    parser.add_argument('--binary-array-threshold', type=int,
+                        metavar='N',
+                        help='store arrays with at least N elements as '
+                        'binary blobs instead of text, off by default')
+    parser.add_argument('--remove-redundant-binds', action='store_true',
+                        help='leave out bind calls that do not change '
+                        'what is bound')
+    parser.add_argument('--write-jobs', type=int, default=4,
+                        help='threads writing payload files, 0 to write '
+                        'them synchronously')
+    parser.add_argument('--write-budget', type=int, default=64,
+                        help='MiB of payload data queued for writing at most')
     parser.add_argument('trace')
     parser.add_argument('output')
     args = parser.parse_args()
 
     exploder = Exploder(args)
     exploder.explode()
+    exploder.print_blob_summary()
+    if args.remove_redundant_binds:
+        print('removed {} redundant bind calls'.format(
+            exploder.num_removed_calls))
 
     create_template_link(args, 'Makefile')
     create_template_link(args, 'replay.cc')
@@ -132,22 +132,55 @@ def gen_trace_header():
     return src
 
 
+def add_name_table(src, entry_type, value_type, table_name, values):
+    """Add a table mapping each function's name to a value.
+
+    values is in the order of FUNCTIONS. The table is sorted by name
+    so that find_name() can binary search it, the file must include
+    <algorithm> and <cstring>.
+    """
+    entries = sorted(zip((func.name for func in FUNCTIONS), values))
+    src.add('namespace {')
+    src.add('struct {} {{'.format(entry_type))
+    src.add('  const char* name;')
+    src.add('  {} value;'.format(value_type))
+    src.add('};')
+    src.add('// Sorted by name')
+    src.add('const {} {}[] = {{'.format(entry_type, table_name))
+    for name, value in entries:
+        src.add('  {{"{}", {}}},'.format(name, value))
+    src.add('};')
+    src.add('template<typename Entry, size_t N>')
+    src.add('const Entry* find_name(const Entry (&table)[N], const char* name) {')
+    src.add('  const auto* entry = std::lower_bound(')
+    src.add('      table, table + N, name,')
+    src.add('      [](const Entry& item, const char* key) {')
+    src.add('        return strcmp(item.name, key) < 0;')
+    src.add('      });')
+    src.add('  if (entry == table + N || strcmp(entry->name, name) != 0) {')
+    src.add('    return nullptr;')
+    src.add('  }')
+    src.add('  return entry;')
+    src.add('}')
+    src.add('}')
+
+
 def gen_trace_source():
     src = Source()
     src.add_cxx_include('pumpkintown_trace_gen.hh')
+    src.add_cxx_include('algorithm', system=True)
     src.add_cxx_include('cstring', system=True)
-    src.add_cxx_include('mutex', system=True)
+    src.add_cxx_include('pumpkintown_function_id.hh')
     src.add_cxx_include('pumpkintown_function_structs.hh')
     src.add_cxx_include('pumpkintown_dlib.hh')
     src.add_cxx_include('pumpkintown_serialize.hh')
     src.add_cxx_include('pumpkintown_trace.hh')
-    src.add('  static std::mutex mutex;')
     for func in FUNCTIONS:
         src.add('{} {{'.format(func.cxx_decl()))
-        if True:
-            src.add('  pumpkintown::print_tids();')
-        if True:
-            src.add('  fprintf(stderr, "{}\\n");'.format(func.name))
+        src.add('  if (pumpkintown::verbose()) {')
+        src.add('    pumpkintown::print_tids();')
+        src.add('    fprintf(stderr, "{}\\n");'.format(func.name))
+        src.add('  }')
         # Call the real function and capture its return value if it has one
         src.add('  {}pumpkintown::real::{}({});'.format(
             'auto return_value = ' if func.has_return() else '',
@@ -157,10 +190,7 @@ def gen_trace_source():
         if func.trace_append:
             src.add('  pumpkintown::trace_append_{}({});'.format(
                 func.name, func.cxx_call_args()))
-        src.add('  std::lock_guard<std::mutex> lock(mutex);')
-        # Store the function ID
-        src.add('  pumpkintown::begin_message("{}");'.format(
-            func.name))
+        ends_frame = 'true' if func.is_swap_buffers() else 'false'
         if func.is_replayable() and not func.is_empty():
             src.add('  pumpkintown::{} fn;'.format(func.cxx_struct_name()))
             if func.has_return() and func.return_type.stype:
@@ -173,23 +203,25 @@ def gen_trace_source():
                     src.add('  fn.{0} = {0};'.format(param.name))
             if func.has_array_params() and not func.custom_io:
                 src.add('  fn.finalize();')
-            src.add('  pumpkintown::serialize()->write(fn.num_bytes());')
-            src.add('  fn.write_to_file(pumpkintown::serialize()->file());')
-            # Prevent double free
-            for param in func.params:
-                if param.array:
-                    src.add('  fn.{} = nullptr;'.format(param.name))
+            src.add('  pumpkintown::serialize()->write_call(')
+            src.add('      pumpkintown::FunctionId::{}, fn, {});'.format(
+                func.name, ends_frame))
         else:
-            src.add('  pumpkintown::serialize()->write(static_cast<uint64_t>(0));')
+            src.add('  pumpkintown::serialize()->write_call(')
+            src.add('      pumpkintown::FunctionId::{}, {});'.format(
+                func.name, ends_frame))
         # Return the real function's result if it has one
         if func.has_return():
             src.add('  return return_value;')
         src.add('}')
+    add_name_table(src, 'ProcEntry', 'void*', 'kProcs',
+                   ('reinterpret_cast<void*>(&{})'.format(func.name)
+                    for func in FUNCTIONS))
     src.add('extern "C" void* glXGetProcAddress(const char* name) {')
-    for func in FUNCTIONS:
-        src.add('  if (strcmp(name, "{}") == 0) {{'.format(func.name))
-        src.add('    return reinterpret_cast<void*>(&{});'.format(func.name))
-        src.add('  }')
+    src.add('  const auto* entry = find_name(kProcs, name);')
+    src.add('  if (entry) {')
+    src.add('    return entry->value;')
+    src.add('  }')
     src.add('  fprintf(stderr, "unknown function: %s\\n", name);')
     src.add('  return nullptr;')
     src.add('}')
@@ -268,7 +300,11 @@ def gen_function_id_header():
     for func in FUNCTIONS:
         src.add('  {} = {},'.format(func.name, func.function_id))
     src.add('};')
+    src.add('// IDs run from 1 to kNumFunctions')
+    src.add('constexpr uint16_t kNumFunctions{{{}}};'.format(len(FUNCTIONS)))
     src.add('FunctionId function_id_from_name(const std::string& name);')
+    src.add('// nullptr for FunctionId::Invalid')
+    src.add('const char* function_name(FunctionId function);')
     src.add('}')
     src.add_guard('PUMPKINTOWN_FUNCTION_ID_HH_')
     return src
@@ -277,13 +313,27 @@ def gen_function_id_header():
 def gen_function_id_source():
     src = Source()
     src.add_cxx_include('pumpkintown_function_id.hh')
+    src.add_cxx_include('algorithm', system=True)
+    src.add_cxx_include('cstring', system=True)
     src.add('namespace pumpkintown {')
+    add_name_table(src, 'FunctionEntry', 'FunctionId', 'kFunctions',
+                   ('FunctionId::{}'.format(func.name)
+                    for func in FUNCTIONS))
     src.add('FunctionId function_id_from_name(const std::string& name) {')
+    src.add('  const auto* entry = find_name(kFunctions, name.c_str());')
+    src.add('  return entry ? entry->value : FunctionId::Invalid;')
+    src.add('}')
+    src.add('namespace {')
+    src.add('// Indexed by FunctionId')
+    src.add('const char* const kFunctionNames[] = {')
+    src.add('  nullptr,')
     for func in FUNCTIONS:
-        src.add('  if (name == "{}") {{'.format(func.name))
-        src.add('    return FunctionId::{};'.format(func.name))
-        src.add('}')
-    src.add('  return FunctionId::Invalid;')
+        src.add('  "{}",'.format(func.name))
+    src.add('};')
+    src.add('}')
+    src.add('const char* function_name(const FunctionId function) {')
+    src.add('  const auto index = static_cast<size_t>(function);')
+    src.add('  return index <= kNumFunctions ? kFunctionNames[index] : nullptr;')
     src.add('}')
     src.add('}')
     return src
@@ -294,19 +344,23 @@ def gen_function_structs_header():
     src.add_cxx_include('cstdio', system=True)
     src.add_cxx_include('cstdint', system=True)
     src.add_cxx_include('string', system=True)
+    src.add_cxx_include('vector', system=True)
     src.add('namespace pumpkintown {')
+    src.add('class CallStorage;')
     for func in FUNCTIONS:
         if func.is_empty():
             continue
         src.add('struct __attribute__((__packed__)) {} {{'.format(
             func.cxx_struct_name()))
         if func.has_array_params():
-            src.add('  ~{}();'.format(func.cxx_struct_name()))
             src.add('  void finalize();')
         src.add('  uint64_t num_bytes() const;')
         src.add('  std::string to_string() const;')
-        src.add('  void read_from_file(FILE* f);')
-        src.add('  void write_to_file(FILE* f);')
+        # Array params point into buf or storage, the struct doesn't
+        # own them
+        src.add('  void read_from_buffer(const uint8_t* buf, uint64_t num_bytes,')
+        src.add('                        CallStorage* storage);')
+        src.add('  void write_to_buffer(std::vector<uint8_t>* buf) const;')
         if func.has_return() and func.return_type.stype:
             src.add('  {} return_value;'.format(func.return_type.stype))
         for param in func.params:
@@ -326,7 +380,9 @@ def gen_function_structs_header():
 def gen_function_structs_source():
     src = Source()
     src.add_cxx_include('pumpkintown_function_structs.hh')
+    src.add_cxx_include('cstring', system=True)
     src.add_cxx_include('sstream', system=True)
+    src.add_cxx_include('stdexcept', system=True)
     src.add_cxx_include('pumpkintown_gl_enum.hh')
     src.add_cxx_include('pumpkintown_gl_util.hh')
     src.add_cxx_include('pumpkintown_io.hh')
@@ -341,12 +397,6 @@ def gen_function_structs_source():
             continue
         if func.custom_io:
             continue
-        if func.has_array_params():
-            src.add('{0}::~{0}() {{'.format(func.cxx_struct_name()))
-            for param in func.params:
-                if param.array:
-                    src.add('  delete[] {};'.format(param.name))
-            src.add('}')
         src.add('uint64_t {}::num_bytes() const {{'.format(func.cxx_struct_name()))
         size_args = ['sizeof(*this)']
         for param in func.params:
@@ -382,27 +432,27 @@ def gen_function_structs_source():
             src.add('  return_string = " -> " + pumpkintown::to_string(return_value);')
         src.add('  return result + ")" + return_string;'.format(func.name))
         src.add('}')
-        src.add('void {}::read_from_file(FILE* f) {{'.format(func.cxx_struct_name()))
-        src.add('  read_exact(f, this, sizeof(*this));')
+        src.add('void {}::read_from_buffer(const uint8_t* buf, const uint64_t num_bytes,'.format(
+            func.cxx_struct_name()))
+        src.add('                          CallStorage* storage) {')
+        src.add('  if (num_bytes < sizeof(*this)) {')
+        src.add('    throw std::runtime_error("truncated call");')
+        src.add('  }')
+        src.add('  memcpy(this, buf, sizeof(*this));')
+        if func.has_array_params():
+            src.add('  uint64_t offset{sizeof(*this)};')
         for param in func.params:
             if param.array:
-                src.add('  if ({}_length > 0) {{'.format(param.name))
-                src.add('    {0}* {1}_tmp = new {0}[{1}_length];'.format(
-                    param.array, param.name))
-                src.add('    read_exact(f, {0}_tmp, {0}_length * sizeof(*{0}));'.format(
-                    param.name))
-                src.add('    {0} = {0}_tmp;'.format(param.name))
-                src.add('  } else {')
-                src.add('    {} = nullptr;'.format(param.name))
-                src.add('  }')
+                src.add('  {0} = read_array<{1}>(buf, num_bytes, &offset, {0}_length, storage);'.format(
+                    param.name, param.array))
         src.add('}')
-        src.add('void {}::write_to_file(FILE* f) {{'.format(func.cxx_struct_name()))
-        src.add('  write_exact(f, this, sizeof(*this));')
+        src.add('void {}::write_to_buffer(std::vector<uint8_t>* buf) const {{'.format(
+            func.cxx_struct_name()))
+        src.add('  append_bytes(buf, this, sizeof(*this));')
         for param in func.params:
             if param.array:
-                src.add('  write_exact(f, {0}, {0}_length * sizeof(*{0}));'.format(
+                src.add('  append_bytes(buf, {0}, {0}_length * sizeof(*{0}));'.format(
                     param.name))
-        src.add('  fflush(f);')
         src.add('}')
     src.add('}')
     return src
@@ -433,7 +483,8 @@ def gen_gl_functions_source():
             func.name,
             ', '.join(param.cxx() for param in func.params)))
         src.add(func.cxx_function_type_alias())
-        src.add('  Fn fn = reinterpret_cast<Fn>(waffle_get_proc_address("{}"));'.format(
+        # Look the function up once, not on every replayed call
+        src.add('  static Fn fn = reinterpret_cast<Fn>(waffle_get_proc_address("{}"));'.format(
             func.name))
         src.add('  {}fn({});'.format(
             'return ' if func.has_return() else '',
@@ -460,28 +511,44 @@ def gen_replay_source():
     for func in FUNCTIONS:
         src.add('  case FunctionId::{}:'.format(func.name))
         if func.no_replay:
-            src.add('    iter_.skip();')
             src.add('    break;')
-        if func.name == 'glXSwapBuffers':
-            src.add('    printf("{}\\n");'.format(func.name))
-            src.add('    waffle_window_swap_buffers(window_);')
+        if func.is_swap_buffers():
+            src.add('    if (!stats_) {')
+            src.add('      printf("{}\\n");'.format(func.name))
+            src.add('    }')
+            src.add('    swap_buffers();')
             src.add('    break;')
             continue
         elif not func.is_replayable():
-            src.add('    printf("{}\\n");'.format(func.name))
-            src.add('    printf("stub\\n");')
+            src.add('    if (!stats_) {')
+            src.add('      printf("{}\\n");'.format(func.name))
+            src.add('      printf("stub\\n");')
+            src.add('    }')
             src.add('    break;')
             continue
         src.add('    {')
         if not func.is_empty():
             src.add('      {} fn;'.format(func.cxx_struct_name()))
-            src.add('      fn.read_from_file(iter_.file());')
-            src.add('      printf("%s\\n", fn.to_string().c_str());')
+            src.add('      fn.read_from_buffer(iter_.payload(), iter_.payload_size(),')
+            src.add('                         iter_.storage());')
+            src.add('      if (!stats_) {')
+            src.add('        printf("%s\\n", fn.to_string().c_str());')
+            src.add('      }')
+        if func.is_draw():
+            src.add('      if (gpu_timer_) {')
+            src.add('        gpu_timer_->begin(call_index_, frame_index_,')
+            src.add('                          FunctionId::{}, c_->program);'.format(
+                func.name))
+            src.add('      }')
         if func.custom_replay:
             src.add('      custom_{}(fn);'.format(func.name))
         else:
             src.add('      {}({});'.format(
                 func.name, ', '.join('fn.' + param.name for param in func.params)))
+        if func.is_draw():
+            src.add('      if (gpu_timer_) {')
+            src.add('        gpu_timer_->end();')
+            src.add('      }')
         src.add('      break;')
         src.add('    }')
     src.add('  }')
@@ -534,7 +601,10 @@ def gen_express_source():
             for index, param in enumerate(func.params):
                 arg = 'arg({})'.format(index)
                 stype = param.ptype.stype
-                if param.array:
+                if param.array == 'uint8_t':
+                    args.append('{} == "null" ? nullptr : '
+                                'uint8_array({})'.format(arg, arg))
+                elif param.array:
                     args.append('{} == "null" ? nullptr : '
                                 '{}_arrays_.at({}).data()'.format(
                         arg,
@@ -591,7 +661,8 @@ def gen_dump_cc():
         src.add('    {')
         if func.params:
             src.add('      {} fn;'.format(func.cxx_struct_name()))
-            src.add('      fn.read(iter_.file());')
+            src.add('      fn.read_from_buffer(iter_.payload(), iter_.payload_size(),')
+            src.add('                         iter_.storage());')
         args = []
         placeholders = []
         src.add('      printf("{\\n");')
@@ -4,6 +4,7 @@ import argparse
 import json
 import os
 
+from pumpkinpy import meta
 from pumpkinpy import parse_xml
 from pumpkinpy.types import Function, Param, Source, Type
 
@@ -56,24 +57,27 @@ def load_glinfo(args):
     with open(path) as rfile:
         root = json.load(rfile)
 
+        functions_by_name = {func.name: func for func in functions}
+        # Overrides of functions dropped above for using an unknown type
+        skipped = []
         for key, val in root.items():
-            found = False
-            for func in functions:
-                if func.name == key:
-                    for param_name, overrides in val.get('params', {}).items():
-                        param = func.param(param_name)
-                        param.array = overrides.get('array')
-                        param.offset = overrides.get('offset')
-                        param.custom_print = overrides.get('custom_print')
-                        param.resource = overrides.get('resource')
-                    func.custom_replay = val.get('custom_replay')
-                    func.no_replay = val.get('no_replay')
-                    func.custom_io = val.get('custom_io')
-                    func.trace_append = val.get('trace_append')
-                    found = True
-                    break
-            if not found:
-                pass #raise KeyError('func not found: ' + key)
+            func = functions_by_name.get(key)
+            if func is None:
+                skipped.append(key)
+                continue
+            for param_name, overrides in val.get('params', {}).items():
+                param = func.param(param_name)
+                param.array = overrides.get('array')
+                param.offset = overrides.get('offset')
+                param.custom_print = overrides.get('custom_print')
+                param.resource = overrides.get('resource')
+            func.custom_replay = val.get('custom_replay')
+            func.no_replay = val.get('no_replay')
+            func.custom_io = val.get('custom_io')
+            func.trace_append = val.get('trace_append')
+            func.explode = val.get('explode')
+        if skipped:
+            print('overrides of unknown functions: ' + ', '.join(skipped))
 
     return functions, enums
 
@@ -89,19 +93,20 @@ def main():
 
     functions, enums = load_glinfo(args)
 
+    meta.save(os.path.join(args.build_dir, 'glmeta.pickle'),
+              functions, enums)
+
     with open(path, 'w') as wfile:
         src = Source()
-        src.add('from pumpkinpy.types import Function, Param, Type')
-        src.add('FUNCTIONS = (')
-        for func in functions:
-            src.add('  {},'.format(func))
-        src.add(')')
-        src.add('ENUMS = {')
-        for key, value in enums.items():
-            src.add("  '{}': {},".format(key, value))
-        src.add('}')
-        for key, value in enums.items():
-            src.add('{} = {}'.format(key, value))
+        src.add('import os')
+        src.add('from pumpkinpy.meta import Metadata')
+        src.add("_META = Metadata.load(os.path.join(os.path.dirname(__file__), 'glmeta.pickle'))")
+        src.add('FUNCTIONS = _META.functions')
+        src.add('FUNCTIONS_BY_NAME = _META.functions_by_name')
+        src.add('FUNCTIONS_BY_ID = _META.functions_by_id')
+        src.add('DECODERS = _META.decoders')
+        src.add('def __getattr__(name):')
+        src.add('    return _META.module_getattr(__name__, name)')
         wfile.write(src.text())
 
 
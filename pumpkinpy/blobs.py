@@ -0,0 +1,108 @@
+"""Write the payload files of exploded traces."""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import struct
+import threading
+
+_TABLE_ENTRY = struct.Struct('<QQ')
+
+
+class BlobWriter:
+    """Write files on a pool of threads.
+
+    At most max_bytes of data are queued or being written at a time,
+    write() blocks until there is room. A single blob larger than the
+    budget is still written, once nothing else is in flight. The data
+    passed to write() must not change until close() returns, in
+    particular memoryviews of a TraceReader's mapping need the reader
+    to stay open until then.
+
+    With jobs=0 files are written synchronously.
+    """
+    def __init__(self, jobs=4, max_bytes=64 * 1024 * 1024):
+        self._executor = None
+        if jobs > 0:
+            self._executor = ThreadPoolExecutor(jobs)
+        self._max_bytes = max_bytes
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._error = None
+
+    def write(self, path, data):
+        if self._executor is None:
+            _write_file(path, data)
+            return
+
+        size = len(data)
+        with self._cond:
+            while (self._error is None and self._in_flight and
+                   self._in_flight + size > self._max_bytes):
+                self._cond.wait()
+            self._raise_error()
+            self._in_flight += size
+        self._executor.submit(self._write, path, data, size)
+
+    def _write(self, path, data, size):
+        try:
+            _write_file(path, data)
+        except BaseException as err:
+            with self._cond:
+                if self._error is None:
+                    self._error = err
+        finally:
+            with self._cond:
+                self._in_flight -= size
+                self._cond.notify_all()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Wait for all writes, raising the first error if any failed."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._raise_error()
+
+
+def _write_file(path, data):
+    with open(path, 'wb') as wfile:
+        wfile.write(data)
+
+
+class BlobArchive:
+    """Pack payloads into one data file plus a table of contents.
+
+    Each blob is appended to blobs.pack, aligned so that replay can
+    hand pointers into the mapped file straight to GL. blobs.table
+    holds a little-endian (uint64 offset, uint64 length) pair per
+    blob. Blobs are referred to by their index in the table.
+    """
+    DATA_NAME = 'blobs.pack'
+    TABLE_NAME = 'blobs.table'
+    ALIGNMENT = 16
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._data = open(os.path.join(directory, self.DATA_NAME), 'wb')
+        self._table = []
+        self._offset = 0
+
+    def add(self, data):
+        padding = -self._offset % self.ALIGNMENT
+        if padding:
+            self._data.write(bytes(padding))
+            self._offset += padding
+        self._data.write(data)
+        self._table.append((self._offset, len(data)))
+        self._offset += len(data)
+        return len(self._table) - 1
+
+    def close(self):
+        self._data.close()
+        path = os.path.join(self._directory, self.TABLE_NAME)
+        with open(path, 'wb') as wfile:
+            for entry in self._table:
+                wfile.write(_TABLE_ENTRY.pack(*entry))
@@ -0,0 +1,193 @@
+"""Chunked compressed container for binary traces.
+
+The trace bytes are split into chunks of a fixed uncompressed size and
+each chunk is compressed on its own with zlib or lzma. A table at the
+end of the file records the offset and sizes of every chunk, so
+reading can start at any offset of the uncompressed stream by
+decompressing a single chunk.
+
+Layout, all integers little-endian:
+
+    header   magic "PTCZ", uint16 version, uint8 codec,
+             uint32 chunk size
+    chunks   the compressed chunks, back to back
+    table    per chunk: uint64 compressed offset, uint32 compressed
+             size, uint32 uncompressed size
+    trailer  uint64 table offset, uint64 number of chunks, magic "PTCI"
+
+CompressedTraceFile reads the uncompressed stream like a regular file,
+and TraceReader opens compressed traces transparently.
+
+    python3 -m pumpkinpy.compressed compress [--codec lzma] raw packed
+    python3 -m pumpkinpy.compressed decompress packed raw
+"""
+
+import argparse
+import bisect
+import io
+import lzma
+import struct
+import zlib
+
+MAGIC = b'PTCZ'
+TRAILER_MAGIC = b'PTCI'
+VERSION = 1
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+_HEADER = struct.Struct('<4sHBI')
+_CHUNK = struct.Struct('<QII')
+_TRAILER = struct.Struct('<QQ4s')
+
+CODECS = {
+    'zlib': (1, lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': (2, lzma.compress, lzma.decompress),
+}
+_DECOMPRESSORS = {codec_id: decompress
+                  for codec_id, _, decompress in CODECS.values()}
+
+
+def is_compressed(rfile):
+    """Check if a file opened for binary reading is a container.
+
+    The file position is restored.
+    """
+    pos = rfile.tell()
+    magic = rfile.read(len(MAGIC))
+    rfile.seek(pos)
+    return magic == MAGIC
+
+
+class CompressedTraceFile(io.RawIOBase):
+    """The uncompressed stream of a container, as a seekable file.
+
+    Only the chunk holding the current position is kept decompressed.
+    """
+    def __init__(self, rfile):
+        super().__init__()
+        self._file = rfile
+        magic, version, codec, self.chunk_size = _HEADER.unpack(
+            rfile.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a compressed trace')
+        self._decompress = _DECOMPRESSORS[codec]
+
+        rfile.seek(-_TRAILER.size, io.SEEK_END)
+        table_offset, num_chunks, magic = _TRAILER.unpack(
+            rfile.read(_TRAILER.size))
+        if magic != TRAILER_MAGIC:
+            raise ValueError('compressed trace is truncated')
+        rfile.seek(table_offset)
+        table = rfile.read(num_chunks * _CHUNK.size)
+        self._chunks = list(_CHUNK.iter_unpack(table))
+        # Uncompressed offset of each chunk
+        self._starts = []
+        size = 0
+        for _, _, length in self._chunks:
+            self._starts.append(size)
+            size += length
+        self.size = size
+
+        self._pos = 0
+        self._chunk_index = None
+        self._chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('negative seek position')
+        self._pos = offset
+        return offset
+
+    def _load_chunk(self, index):
+        if index != self._chunk_index:
+            offset, size, _ = self._chunks[index]
+            self._file.seek(offset)
+            self._chunk = memoryview(self._decompress(self._file.read(size)))
+            self._chunk_index = index
+
+    def readinto(self, buf):
+        if self._pos >= self.size:
+            return 0
+        index = bisect.bisect_right(self._starts, self._pos) - 1
+        self._load_chunk(index)
+        start = self._pos - self._starts[index]
+        count = min(len(buf), len(self._chunk) - start)
+        buf[:count] = self._chunk[start:start + count]
+        self._pos += count
+        return count
+
+
+def compress(src, dst, codec='zlib', chunk_size=DEFAULT_CHUNK_SIZE):
+    codec_id, compress_chunk, _ = CODECS[codec]
+    table = []
+    with open(src, 'rb') as rfile, open(dst, 'wb') as wfile:
+        wfile.write(_HEADER.pack(MAGIC, VERSION, codec_id, chunk_size))
+        offset = _HEADER.size
+        while True:
+            chunk = rfile.read(chunk_size)
+            if not chunk:
+                break
+            data = compress_chunk(chunk)
+            wfile.write(data)
+            table.append((offset, len(data), len(chunk)))
+            offset += len(data)
+        for entry in table:
+            wfile.write(_CHUNK.pack(*entry))
+        wfile.write(_TRAILER.pack(offset, len(table), TRAILER_MAGIC))
+
+
+def decompress(src, dst):
+    with open(src, 'rb') as rfile, open(dst, 'wb') as wfile:
+        stream = CompressedTraceFile(rfile)
+        while True:
+            chunk = stream.read(stream.chunk_size)
+            if not chunk:
+                break
+            wfile.write(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert traces to and from the compressed container.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compress_parser = subparsers.add_parser('compress')
+    compress_parser.add_argument('--codec', choices=sorted(CODECS),
+                                 default='zlib')
+    compress_parser.add_argument('--chunk-size', type=int,
+                                 default=DEFAULT_CHUNK_SIZE,
+                                 help='uncompressed bytes per chunk')
+    compress_parser.add_argument('src')
+    compress_parser.add_argument('dst')
+    decompress_parser = subparsers.add_parser('decompress')
+    decompress_parser.add_argument('src')
+    decompress_parser.add_argument('dst')
+    args = parser.parse_args()
+
+    if args.command == 'compress':
+        compress(args.src, args.dst, args.codec, args.chunk_size)
+    else:
+        decompress(args.src, args.dst)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import struct
+
+import attr
+
+
+def py_struct_type(stype):
+    return {'const void*': 'Q',
+            'char': 'c',
+            'double': 'd',
+            'float': 'f',
+            'int8_t': 'b',
+            'int16_t': 'h',
+            'int32_t': 'i',
+            'int64_t': 'q',
+            'uint8_t': 'B',
+            'uint16_t': 'H',
+            'uint32_t': 'I',
+            'uint64_t': 'Q',
+    }[stype]
+
+
+def numpy_dtype(stype):
+    return {'double': '<f8',
+            'float': '<f4',
+            'int8_t': 'i1',
+            'int16_t': '<i2',
+            'int32_t': '<i4',
+            'int64_t': '<i8',
+            'uint16_t': '<u2',
+            'uint32_t': '<u4',
+            'uint64_t': '<u8',
+    }[stype]
+
+
+def is_byte_array(array):
+    return array in ('uint8_t', 'char')
+
+
+@attr.s
+class ArrayParam:
+    """Layout of an array param's payload, which follows the struct."""
+    name = attr.ib()
+    array = attr.ib()
+    length_field = attr.ib(init=False)
+    elem = attr.ib(init=False)
+    dtype = attr.ib(init=False)
+
+    def __attrs_post_init__(self):
+        self.length_field = f'{self.name}_length'
+        if is_byte_array(self.array):
+            self.elem = None
+            self.dtype = None
+        else:
+            self.elem = struct.Struct('<' + py_struct_type(self.array))
+            self.dtype = numpy_dtype(self.array)
+
+
+@attr.s
+class Decoder:
+    """Precompiled layout of one function's call message.
+
+    The body struct matches the packed C++ Fn* struct. Array params
+    occupy two fields in it (length and pointer), their data follows
+    the struct in param order. Functions with custom_io lay out their
+    array data themselves, so they have no arrays here.
+    """
+    fmt = attr.ib()
+    field_names = attr.ib()
+    arrays = attr.ib(default=())
+    body = attr.ib(init=False, repr=False)
+    has_return = attr.ib(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self.body = struct.Struct(self.fmt)
+        self.has_return = 'return_value' in self.field_names
+
+
+def build_decoder(func):
+    """Build the decoder for a function, or None if it isn't traced."""
+    if not func.is_replayable():
+        return None
+
+    fmt = '<'
+    field_names = []
+    arrays = []
+    # Add return value
+    if func.has_return() and func.return_type.stype:
+        fmt += py_struct_type(func.return_type.stype)
+        field_names.append('return_value')
+    # Add parameters
+    for param in func.params:
+        if param.array:
+            field_names += [f'{param.name}_length', param.name]
+            fmt += 'QQ'
+            if not func.custom_io:
+                arrays.append(ArrayParam(param.name, param.array))
+        elif param.offset:
+            field_names.append(param.name)
+            fmt += 'Q'
+        elif param.ptype.stype:
+            field_names.append(param.name)
+            fmt += py_struct_type(param.ptype.stype)
+        else:
+            raise RuntimeError('cannot decode {}.{}'.format(
+                func.name, param.name))
+    return Decoder(fmt, tuple(field_names), tuple(arrays))
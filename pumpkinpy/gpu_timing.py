@@ -0,0 +1,154 @@
+"""Summarize the draw call GPU times of a profiling replay.
+
+    build/pumpkintown_replay --gpu-timing times.csv trace
+    python3 -m pumpkinpy.gpu_timing [--json] [--top N] times.csv
+
+Totals the GPU time per program and per function, and lists the most
+expensive single draws. Programs are named by their ID in the trace.
+"""
+
+import argparse
+import csv
+import heapq
+import json
+import sys
+
+import attr
+
+
+@attr.s
+class GroupStats:
+    calls = attr.ib(default=0)
+    ns = attr.ib(default=0)
+    max_ns = attr.ib(default=0)
+
+    def add(self, ns):
+        self.calls += 1
+        self.ns += ns
+        self.max_ns = max(self.max_ns, ns)
+
+    @property
+    def mean_ns(self):
+        return self.ns / self.calls if self.calls else 0.0
+
+
+@attr.s
+class Draw:
+    call_index = attr.ib()
+    frame = attr.ib()
+    function = attr.ib()
+    program = attr.ib()
+    ns = attr.ib()
+
+
+class GpuTiming:
+    def __init__(self, top=10):
+        self.top = top
+        self.total = GroupStats()
+        self.frames = set()
+        # Program ID -> GroupStats
+        self.programs = {}
+        # Function name -> GroupStats
+        self.functions = {}
+        # Min-heap of (ns, -call index, frame, function, program)
+        self._slowest = []
+
+    def load(self, rfile):
+        for row in csv.DictReader(rfile):
+            draw = Draw(int(row['call']), int(row['frame']), row['function'],
+                        int(row['program']), int(row['gpu_ns']))
+            self.total.add(draw.ns)
+            self.frames.add(draw.frame)
+            self.programs.setdefault(draw.program, GroupStats()).add(draw.ns)
+            self.functions.setdefault(draw.function, GroupStats()).add(draw.ns)
+            self._add_draw(draw)
+
+    def _add_draw(self, draw):
+        if self.top <= 0:
+            return
+        item = (draw.ns, -draw.call_index, draw.frame, draw.function,
+                draw.program)
+        if len(self._slowest) < self.top:
+            heapq.heappush(self._slowest, item)
+        elif item > self._slowest[0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def slowest_draws(self):
+        """The most expensive draws, slowest first."""
+        return [Draw(-call_index, frame, function, program, ns)
+                for ns, call_index, frame, function, program
+                in sorted(self._slowest, reverse=True)]
+
+
+def _group_json(group):
+    return dict(attr.asdict(group), mean_ns=group.mean_ns)
+
+
+def to_json(timing, top):
+    return {
+        'draws': timing.total.calls,
+        'frames': len(timing.frames),
+        'gpu_ns': timing.total.ns,
+        'programs': {str(program): _group_json(group)
+                     for program, group in timing.programs.items()},
+        'functions': {name: _group_json(group)
+                      for name, group in timing.functions.items()},
+        'slowest_draws': [attr.asdict(draw) for draw in top],
+    }
+
+
+def _print_groups(label, groups, total_ns):
+    print('{:>10} {:>12} {:>7} {:>10} {:>10}  {}'.format(
+        'draws', 'gpu ms', 'share', 'mean us', 'max us', label))
+    for key, group in sorted(groups.items(),
+                             key=lambda item: (-item[1].ns, item[0])):
+        print('{:10} {:12.3f} {:6.1f}% {:10.2f} {:10.2f}  {}'.format(
+            group.calls, group.ns / 1e6,
+            100 * group.ns / total_ns if total_ns else 0.0,
+            group.mean_ns / 1e3, group.max_ns / 1e3, key))
+
+
+def print_text(timing, top):
+    frames = len(timing.frames)
+    print('{} draws in {} frames, {:.3f} ms GPU time ({:.3f} ms per '
+          'frame)'.format(timing.total.calls, frames, timing.total.ns / 1e6,
+                          timing.total.ns / 1e6 / frames if frames else 0.0))
+    print()
+    _print_groups('program', timing.programs, timing.total.ns)
+    print()
+    _print_groups('function', timing.functions, timing.total.ns)
+
+    if top:
+        print()
+        print('{:>10} {:>10} {:>8} {:>8}  {}'.format(
+            'us', 'call', 'frame', 'program', 'function'))
+        for draw in top:
+            print('{:10.2f} {:10} {:8} {:8}  {}'.format(
+                draw.ns / 1e3, draw.call_index, draw.frame, draw.program,
+                draw.function))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Summarize the GPU times of a profiling replay.')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest draws to list, 0 for none')
+    parser.add_argument('times', help='CSV written by --gpu-timing')
+    args = parser.parse_args()
+
+    timing = GpuTiming(args.top)
+    with open(args.times, newline='') as rfile:
+        timing.load(rfile)
+    top = timing.slowest_draws()
+
+    if args.json:
+        json.dump(to_json(timing, top), sys.stdout, indent=2)
+        print()
+    else:
+        print_text(timing, top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Compact storage for the generated glmeta module.
+
+gen_meta.py packs the function, type, decoder and enum metadata into
+nested tuples of plain values and pickles them to glmeta.pickle next
+to a small glmeta.py that loads it. Function and Decoder objects and
+the enum lookup are only built when something asks for them, so
+importing glmeta stays cheap no matter how large the registry is.
+"""
+
+from collections.abc import Mapping, Sequence
+import pickle
+
+import attr
+
+from pumpkinpy.decoder import ArrayParam, Decoder, build_decoder
+from pumpkinpy.types import Function, Param, Type
+
+# Bump when the packed layout changes
+FORMAT_VERSION = 2
+
+# Fields stored positionally, everything else is stored as
+# (name, value) pairs when it differs from the default
+_FUNCTION_FIELDS = ('function_id', 'name', 'return_type', 'params')
+_PARAM_FIELDS = ('ptype', 'name')
+
+
+def _extra_fields(obj, skip):
+    pairs = []
+    for field in attr.fields(type(obj)):
+        if field.name in skip:
+            continue
+        value = getattr(obj, field.name)
+        if value != field.default:
+            pairs.append((field.name, value))
+    return tuple(pairs)
+
+
+def pack(functions):
+    """Pack functions into (types, functions, decoders) tuples.
+
+    Function IDs must run from 1 without gaps, the ID is implied by
+    the position in the packed tuple.
+    """
+    type_indices = {}
+    types = []
+
+    def type_index(typ):
+        key = attr.astuple(typ)
+        if key not in type_indices:
+            type_indices[key] = len(types)
+            types.append(key)
+        return type_indices[key]
+
+    packed_functions = []
+    packed_decoders = []
+    for index, func in enumerate(functions, 1):
+        assert func.function_id == index
+        params = tuple((param.name, type_index(param.ptype),
+                        _extra_fields(param, _PARAM_FIELDS))
+                       for param in func.params)
+        packed_functions.append((func.name, type_index(func.return_type),
+                                 params,
+                                 _extra_fields(func, _FUNCTION_FIELDS)))
+        decoder = build_decoder(func)
+        if decoder:
+            arrays = tuple((array.name, array.array)
+                           for array in decoder.arrays)
+            packed_decoders.append((decoder.fmt, decoder.field_names,
+                                    arrays))
+        else:
+            packed_decoders.append(None)
+    return tuple(types), tuple(packed_functions), tuple(packed_decoders)
+
+
+def save(path, functions, enums):
+    types, packed_functions, packed_decoders = pack(functions)
+    data = (FORMAT_VERSION, types, packed_functions, packed_decoders,
+            tuple(enums.keys()), tuple(enums.values()))
+    with open(path, 'wb') as wfile:
+        pickle.dump(data, wfile, protocol=4)
+
+
+class FunctionTable(Sequence):
+    """FUNCTIONS, with each Function built on first access."""
+    def __init__(self, types, packed):
+        self._types = types
+        self._packed = packed
+        self._cache = [None] * len(packed)
+
+    def __len__(self):
+        return len(self._packed)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        func = self._cache[index]
+        if func is None:
+            func = self._build(index % len(self))
+            self._cache[index] = func
+        return func
+
+    def _build(self, index):
+        name, rtype, packed_params, extra = self._packed[index]
+        params = []
+        for param_name, ptype, param_extra in packed_params:
+            params.append(Param(name=param_name, ptype=self._types[ptype],
+                                **dict(param_extra)))
+        return Function(index + 1, name, self._types[rtype], params,
+                        **dict(extra))
+
+
+class FunctionsByName(Mapping):
+    def __init__(self, functions, packed):
+        self._functions = functions
+        self._packed = packed
+        self._indices = None
+
+    def _index(self):
+        if self._indices is None:
+            self._indices = {packed[0]: index
+                             for index, packed in enumerate(self._packed)}
+        return self._indices
+
+    def __getitem__(self, name):
+        return self._functions[self._index()[name]]
+
+    def __contains__(self, name):
+        return name in self._index()
+
+    def __iter__(self):
+        return iter(self._index())
+
+    def __len__(self):
+        return len(self._packed)
+
+
+class FunctionsById(Mapping):
+    def __init__(self, functions):
+        self._functions = functions
+
+    def __getitem__(self, function_id):
+        if not isinstance(function_id, int) or not (
+                1 <= function_id <= len(self._functions)):
+            raise KeyError(function_id)
+        return self._functions[function_id - 1]
+
+    def __iter__(self):
+        return iter(range(1, len(self._functions) + 1))
+
+    def __len__(self):
+        return len(self._functions)
+
+
+class DecoderTable(Sequence):
+    """DECODERS, indexed by function ID with None at index 0."""
+    def __init__(self, packed):
+        self._packed = (None,) + packed
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._packed)
+
+    def __getitem__(self, function_id):
+        try:
+            return self._cache[function_id]
+        except KeyError:
+            pass
+        packed = self._packed[function_id]
+        decoder = None
+        if packed is not None:
+            fmt, field_names, arrays = packed
+            decoder = Decoder(fmt, field_names, tuple(
+                ArrayParam(name, array) for name, array in arrays))
+        self._cache[function_id] = decoder
+        return decoder
+
+
+class Metadata:
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as rfile:
+            version, *data = pickle.load(rfile)
+        if version != FORMAT_VERSION:
+            raise RuntimeError('{} is out of date, rerun gen_meta.py'.format(
+                path))
+        return cls(*data)
+
+    def __init__(self, types, functions, decoders, enum_names, enum_values):
+        self.types = tuple(Type(*typ) for typ in types)
+        self.functions = FunctionTable(self.types, functions)
+        self.functions_by_name = FunctionsByName(self.functions, functions)
+        self.functions_by_id = FunctionsById(self.functions)
+        self.decoders = DecoderTable(decoders)
+        self._enum_names = enum_names
+        self._enum_values = enum_values
+        self._enums = None
+
+    @property
+    def enums(self):
+        if self._enums is None:
+            self._enums = dict(zip(self._enum_names, self._enum_values))
+        return self._enums
+
+    def module_getattr(self, module, name):
+        """Implements __getattr__ for the glmeta module.
+
+        ENUMS and the individual enum constants are resolved here
+        instead of being defined as module globals.
+        """
+        if name == 'ENUMS':
+            return self.enums
+        try:
+            return self.enums[name]
+        except KeyError:
+            raise AttributeError(
+                'module {!r} has no attribute {!r}'.format(module, name))
@@ -0,0 +1,229 @@
+"""Run per-call analyses over a trace in parallel.
+
+The trace is split into chunks on call boundaries using its index (see
+pumpkinpy.trace_index). Each chunk is read by a worker process with its
+own memory-mapped TraceReader, the worker folds the calls into a
+partial result with a Reducer, and the partial results are merged in
+trace order.
+
+    python3 -m pumpkinpy.parallel --jobs 8 trace
+"""
+
+import abc
+import argparse
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import os
+import sys
+import time
+
+import attr
+
+from pumpkinpy.trace_index import load_or_build_index
+from pumpkinpy.trace_reader import Call, TraceReader
+
+# TODO
+sys.path.append('build')
+import glmeta
+
+
+@attr.s
+class Chunk:
+    """A run of consecutive calls handed to one worker."""
+    # Offset of the first call message
+    offset = attr.ib()
+    # Index of the first call and one past the last
+    start = attr.ib()
+    stop = attr.ib()
+    # Frame the first call belongs to
+    frame = attr.ib()
+    # Index of the first call of each frame that starts in the chunk
+    frame_starts = attr.ib()
+    # Every function ID in the trace
+    function_names = attr.ib()
+
+
+class Reducer(abc.ABC):
+    """Per-call analysis that parallel_reduce runs on each chunk.
+
+    Subclasses must be picklable since they are sent to the workers.
+    The partial results of the chunks are merged in trace order, so a
+    frame can be split between two partial results.
+    """
+    # If false, calls only have func and size, fields is None. This
+    # is much cheaper and also includes calls read() would skip.
+    decode = True
+    # Function names or a predicate on Function to restrict the calls
+    # to, see TraceReader.select
+    wanted = None
+
+    @abc.abstractmethod
+    def initial(self):
+        """Return an empty partial result."""
+
+    @abc.abstractmethod
+    def add(self, result, call, frame):
+        """Fold a call into a partial result and return the result."""
+
+    @abc.abstractmethod
+    def merge(self, result, other):
+        """Merge the partial result of the next chunk into result."""
+
+
+class CallHistogram(Reducer):
+    """Number of calls and payload bytes per function name."""
+    decode = False
+
+    def initial(self):
+        return {}
+
+    def add(self, result, call, frame):
+        count, size = result.get(call.func.name, (0, 0))
+        result[call.func.name] = (count + 1, size + call.size)
+        return result
+
+    def merge(self, result, other):
+        for name, (count, size) in other.items():
+            prev_count, prev_size = result.get(name, (0, 0))
+            result[name] = (prev_count + count, prev_size + size)
+        return result
+
+
+class FrameStats(Reducer):
+    """Number of calls and payload bytes per frame."""
+    decode = False
+
+    def initial(self):
+        return {}
+
+    def add(self, result, call, frame):
+        count, size = result.get(frame, (0, 0))
+        result[frame] = (count + 1, size + call.size)
+        return result
+
+    merge = CallHistogram.merge
+
+
+def split(index, num_chunks):
+    """Split an indexed trace into about num_chunks chunks of equal size."""
+    num_calls = len(index)
+    if num_calls == 0:
+        return []
+    # Offsets are in the uncompressed stream, which can be larger than
+    # the trace file
+    end = index.offsets[-1] + index.sizes[-1]
+    chunks = []
+    start = 0
+    for i in range(1, num_chunks + 1):
+        if i == num_chunks:
+            stop = num_calls
+        else:
+            target = end * i // num_chunks
+            stop = bisect.bisect_left(index.offsets, target, start)
+        if stop <= start:
+            continue
+        first_frame = bisect.bisect_right(index.frame_starts, start) - 1
+        last_frame = bisect.bisect_left(index.frame_starts, stop)
+        chunks.append(Chunk(
+            offset=index.offsets[start], start=start, stop=stop,
+            frame=max(first_frame, 0),
+            frame_starts=index.frame_starts[first_frame + 1:last_frame],
+            function_names=index.function_names))
+        start = stop
+    return chunks
+
+
+def _calls(reader, reducer, chunk):
+    if not reducer.decode:
+        for _, dyn_id, size in reader.scan():
+            name = reader.function_names[dyn_id]
+            yield Call(glmeta.FUNCTIONS_BY_NAME[name], None, size=size)
+            if reader.call_index == chunk.stop:
+                return
+    elif reducer.wanted is not None:
+        yield from reader.select(reducer.wanted, stop=chunk.stop)
+    else:
+        while reader.call_index != chunk.stop:
+            # A StopIteration escaping the generator would turn into a
+            # RuntimeError, report the mismatch below instead
+            try:
+                call = reader.read()
+            except StopIteration:
+                break
+            if call:
+                yield call
+    if reader.call_index != chunk.stop:
+        raise ValueError(
+            'index does not match trace: it ended at call {}, the index '
+            'has calls up to {}'.format(reader.call_index, chunk.stop))
+
+
+def reduce_chunk(trace_path, reducer, chunk):
+    reader = TraceReader(trace_path, use_mmap=True)
+    reader.set_function_names(chunk.function_names)
+    reader.seek(chunk.offset, chunk.start)
+
+    result = reducer.initial()
+    frame = chunk.frame
+    frame_starts = iter(chunk.frame_starts)
+    next_frame = next(frame_starts, None)
+    for call in _calls(reader, reducer, chunk):
+        # The call just read is the one before reader.call_index
+        while next_frame is not None and next_frame < reader.call_index:
+            frame += 1
+            next_frame = next(frame_starts, None)
+        result = reducer.add(result, call, frame)
+    # Drop the views into the mapping before closing it
+    call = None
+    reader.close()
+    return result
+
+
+def parallel_reduce(trace_path, reducer, jobs=None, index=None,
+                    chunks_per_job=4):
+    """Run reducer over every call in a trace using jobs processes.
+
+    If no index is given the trace's sidecar index is used, or built
+    in memory if there is none.
+    """
+    if jobs is None:
+        jobs = os.cpu_count()
+    if index is None:
+        index = load_or_build_index(trace_path, save=False)
+    chunks = split(index, jobs * chunks_per_job)
+    if jobs == 1:
+        results = [reduce_chunk(trace_path, reducer, chunk)
+                   for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(
+                functools.partial(reduce_chunk, trace_path, reducer),
+                chunks))
+    return functools.reduce(reducer.merge, results, reducer.initial())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Count the calls and payload bytes per function.')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='number of worker processes')
+    parser.add_argument('trace')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = load_or_build_index(args.trace, save=False)
+    index_time = time.perf_counter() - start
+    start = time.perf_counter()
+    histogram = parallel_reduce(args.trace, CallHistogram(), args.jobs,
+                                index)
+    elapsed = time.perf_counter() - start
+
+    for name, (count, size) in sorted(histogram.items(),
+                                      key=lambda item: -item[1][0]):
+        print('{:10} {:14} {}'.format(count, size, name))
+    print('index {:.3f}s, scan {:.3f}s'.format(index_time, elapsed))
+
+
+if __name__ == '__main__':
+    main()
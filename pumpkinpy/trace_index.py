@@ -0,0 +1,195 @@
+"""Sidecar offset index for binary traces.
+
+The index is built in one pass over the call headers and saved next to
+the trace as <trace>.idx. It holds the offset, function ID and payload
+size of every call message, the call index at which each frame starts
+and the names of the function IDs, which is everything TraceReader
+needs to start reading at an arbitrary call.
+
+Traces closed cleanly by the tracer already end with the same index in
+their footer message, so they don't need a sidecar.
+
+    python3 -m pumpkinpy.trace_index trace
+"""
+
+import argparse
+from array import array
+import os
+import struct
+import sys
+
+from pumpkinpy.trace_reader import TraceReader
+
+# TODO
+sys.path.append('build')
+import glmeta
+
+MAGIC = b'PTIDX\0'
+VERSION = 1
+
+# magic, version, trace size, number of names, calls and frames
+_HEADER = struct.Struct('<6sHQIQQ')
+_NAME_HEADER = struct.Struct('<HB')
+# Footer message after its tag: number of names, calls and frames
+_FOOTER_HEADER = struct.Struct('<QQQ')
+
+
+def index_path(trace_path):
+    return trace_path + '.idx'
+
+
+class TraceIndex:
+    def __init__(self, trace_size=0, function_names=None):
+        self.trace_size = trace_size
+        if function_names is None:
+            function_names = {}
+        self.function_names = function_names
+        self.offsets = array('Q')
+        self.function_ids = array('H')
+        self.sizes = array('Q')
+        self.frame_starts = array('Q')
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def num_frames(self):
+        return len(self.frame_starts)
+
+    def check(self, tfile):
+        """Make sure the index belongs to an open trace file."""
+        if os.fstat(tfile.fileno()).st_size != self.trace_size:
+            raise ValueError('trace index is stale, rebuild it')
+
+    def save(self, path):
+        with open(path, 'wb') as wfile:
+            wfile.write(_HEADER.pack(MAGIC, VERSION, self.trace_size,
+                                     len(self.function_names),
+                                     len(self.offsets),
+                                     len(self.frame_starts)))
+            self._write_tables(wfile)
+
+    def write_footer(self, wfile):
+        """Write the footer message body, after its tag byte."""
+        wfile.write(_FOOTER_HEADER.pack(len(self.function_names),
+                                        len(self.offsets),
+                                        len(self.frame_starts)))
+        self._write_tables(wfile)
+
+    def _write_tables(self, wfile):
+        for dyn_id, name in sorted(self.function_names.items()):
+            name = name.encode('utf-8')
+            wfile.write(_NAME_HEADER.pack(dyn_id, len(name)))
+            wfile.write(name)
+        for arr in (self.offsets, self.function_ids, self.sizes,
+                    self.frame_starts):
+            _to_little_endian(arr).tofile(wfile)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as rfile:
+            header = rfile.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise ValueError('truncated trace index')
+            (magic, version, trace_size, num_names, num_calls,
+             num_frames) = _HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('not a trace index: ' + path)
+            index = cls(trace_size)
+            index._read_tables(rfile, num_names, num_calls, num_frames)
+        return index
+
+    @classmethod
+    def read_footer(cls, rfile, trace_size):
+        """Read a footer message body, after its tag byte."""
+        num_names, num_calls, num_frames = _FOOTER_HEADER.unpack(
+            rfile.read(_FOOTER_HEADER.size))
+        index = cls(trace_size)
+        index._read_tables(rfile, num_names, num_calls, num_frames)
+        return index
+
+    def _read_tables(self, rfile, num_names, num_calls, num_frames):
+        for _ in range(num_names):
+            dyn_id, name_len = _NAME_HEADER.unpack(
+                rfile.read(_NAME_HEADER.size))
+            self.function_names[dyn_id] = str(rfile.read(name_len), 'utf-8')
+        for arr, count in ((self.offsets, num_calls),
+                           (self.function_ids, num_calls),
+                           (self.sizes, num_calls),
+                           (self.frame_starts, num_frames)):
+            arr.frombytes(rfile.read(count * arr.itemsize))
+            if len(arr) != count:
+                raise ValueError('truncated trace index')
+            _to_little_endian(arr)
+
+
+def _to_little_endian(arr):
+    # The arrays are swapped in place, this is its own inverse
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+def build_index(trace_path):
+    """Make one pass over a trace and return its TraceIndex."""
+    reader = TraceReader(trace_path, use_mmap=True)
+    index = TraceIndex(os.path.getsize(trace_path), reader.function_names)
+    swaps = {}
+    new_frame = True
+    for offset, dyn_id, size in reader.scan():
+        if new_frame:
+            index.frame_starts.append(len(index.offsets))
+            new_frame = False
+        index.offsets.append(offset)
+        index.function_ids.append(dyn_id)
+        index.sizes.append(size)
+
+        is_swap = swaps.get(dyn_id)
+        if is_swap is None:
+            name = reader.function_names[dyn_id]
+            is_swap = glmeta.FUNCTIONS_BY_NAME[name].is_swap_buffers()
+            swaps[dyn_id] = is_swap
+        if is_swap:
+            new_frame = True
+    reader.close()
+    return index
+
+
+def load_or_build_index(trace_path, save=True):
+    """Get the index of a trace from its footer or sidecar index.
+
+    If it has neither, the index is built and saved next to the trace
+    unless save is false.
+    """
+    reader = TraceReader(trace_path)
+    index = reader.read_footer()
+    reader.close()
+    if index is not None:
+        return index
+
+    path = index_path(trace_path)
+    if os.path.exists(path):
+        index = TraceIndex.load(path)
+        if index.trace_size == os.path.getsize(trace_path):
+            return index
+    index = build_index(trace_path)
+    if save:
+        index.save(path)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build the sidecar offset index of a trace.')
+    parser.add_argument('-o', '--output',
+                        help='index path, defaults to TRACE.idx')
+    parser.add_argument('trace')
+    args = parser.parse_args()
+
+    index = build_index(args.trace)
+    index.save(args.output or index_path(args.trace))
+    print('{} calls, {} frames'.format(len(index), index.num_frames))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,18 @@
+import io
+import mmap
+import os
 import struct
 import sys
 
 import attr
 
+from pumpkinpy import compressed
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # TODO
 sys.path.append('build')
 import glmeta
@@ -12,29 +22,336 @@ class Call:
     func = attr.ib()
     fields = attr.ib()
     return_value = attr.ib(default=None)
+    # Payload size in the trace
+    size = attr.ib(default=0)
+
+
+# See pumpkintown_io.hh
+MAGIC = b'PTRC'
+# Version 2 added the function table to the header
+VERSION = 2
+FOOTER_MAGIC = b'PTFT'
+
+# magic, version, pointer size, platform name length
+_TRACE_HEADER = struct.Struct('<4sHBB')
+_NUM_FUNCTIONS = struct.Struct('<H')
+_FUNCTION_ID_HEADER = struct.Struct('<HB')
+_CALL_HEADER = struct.Struct('<HQ')
+# footer offset, magic
+_TRAILER = struct.Struct('<Q4s')
+
+
+class _FunctionMap(dict):
+    """(Function, Decoder) of each function ID used in a trace.
 
-    
-def py_struct_type(stype):
-    return {'const void*': 'Q',
-            'char': 'c',
-            'double': 'd',
-            'float': 'f',
-            'int32_t': 'i',
-            'int64_t': 'q',
-            'uint8_t': 'B',
-            'uint32_t': 'I',
-            'uint64_t': 'Q',
-    }[stype]
+    Entries are filled in on first use of an ID, after which looking
+    one up is a plain dict index.
+    """
+    def __init__(self, function_names):
+        super().__init__()
+        self._function_names = function_names
+
+    def __missing__(self, dyn_id):
+        func = glmeta.FUNCTIONS_BY_NAME[self._function_names[dyn_id]]
+        entry = (func, glmeta.DECODERS[func.function_id])
+        self[dyn_id] = entry
+        return entry
+
+
+@attr.s
+class TraceHeader:
+    version = attr.ib()
+    pointer_size = attr.ib()
+    # Like "Linux x86_64"
+    platform = attr.ib()
 
 
 class TraceReader:
-    def __init__(self, path):
+    """Read calls from a binary trace.
+
+    If use_mmap is true the trace is memory-mapped and walked by
+    offset. Array and blob params are then returned as memoryview
+    slices of the mapping instead of copies, so they are only valid
+    until the reader is closed.
+
+    Traces in the compressed container (see pumpkinpy.compressed) are
+    decompressed as they are read. They can't be memory-mapped, so
+    use_mmap is ignored for them.
+
+    With a TraceIndex (see pumpkinpy.trace_index) the reader can jump
+    to any call or frame and iterate backwards. Traces the tracer
+    closed cleanly carry their index in a footer, which is used when
+    no index is given. Traces without one, like those of programs that
+    crashed, are scanned once to build the index the first time it is
+    needed.
+
+    header is None for traces written before the format had one.
+    From version 2 the header declares every function ID up front, so
+    function_names holds all of them from the start.
+
+    If numpy_arrays is true, array params other than byte arrays are
+    returned as read-only NumPy arrays over the payload instead of
+    lists. Byte arrays are returned as bytes (or memoryviews) either
+    way.
+    """
+    def __init__(self, path, use_mmap=False, index=None,
+                 numpy_arrays=False):
+        if numpy_arrays and numpy is None:
+            raise RuntimeError('numpy_arrays requires numpy')
+        self._numpy_arrays = numpy_arrays
+        self._path = path
         self._file = open(path, 'rb')
-        self._function_map = {}
+        self.compressed = compressed.is_compressed(self._file)
+        if self.compressed:
+            self._file = io.BufferedReader(
+                compressed.CompressedTraceFile(self._file))
+        self._mmap = None
+        self._view = None
+        self._offset = 0
+        # Name of each function ID declared so far
+        self.function_names = {}
+        self._function_map = _FunctionMap(self.function_names)
+        self.header = self._read_header()
+        # Index of the next call message in the trace
+        self.call_index = 0
+        self._index = None
+        # Whether the footer still needs to be looked for
+        self._check_footer = index is None
+        if use_mmap and not self.compressed:
+            self._open_mmap()
+        if index is not None:
+            index.check(self._file)
+            self._set_index(index)
+
+    def _read_header(self):
+        buf = self._file.read(_TRACE_HEADER.size)
+        if buf[:len(MAGIC)] != MAGIC:
+            # No header, the trace starts with the first message
+            self._file.seek(0)
+            return None
+        if len(buf) != _TRACE_HEADER.size:
+            raise ValueError('truncated trace header')
+        magic, version, pointer_size, platform_len = _TRACE_HEADER.unpack(buf)
+        if not 1 <= version <= VERSION:
+            raise ValueError('unsupported trace version {}'.format(version))
+        platform = str(self._file.read(platform_len), 'utf-8')
+        if version >= 2:
+            num_functions, = _NUM_FUNCTIONS.unpack(
+                self._file.read(_NUM_FUNCTIONS.size))
+            for _ in range(num_functions):
+                dyn_id, name_len = _FUNCTION_ID_HEADER.unpack(
+                    self._file.read(_FUNCTION_ID_HEADER.size))
+                name = str(self._file.read(name_len), 'utf-8')
+                # The tracer may know functions glmeta doesn't, that's
+                # only an error if they are called
+                if name in glmeta.FUNCTIONS_BY_NAME:
+                    self._set_function_id(dyn_id, name)
+        return TraceHeader(version, pointer_size, platform)
+
+    @property
+    def index(self):
+        """The TraceIndex passed in or read from the footer, if any."""
+        if self._check_footer:
+            self._check_footer = False
+            index = self.read_footer()
+            if index is not None:
+                self._set_index(index)
+        return self._index
+
+    def _set_index(self, index):
+        self._index = index
+        self.set_function_names(index.function_names)
+
+    def read_footer(self):
+        """Load the TraceIndex stored in the trace's footer.
+
+        Returns None if the trace has no footer, for instance because
+        the traced program didn't exit cleanly. The read position is
+        kept.
+        """
+        # trace_index imports this module
+        from pumpkinpy.trace_index import TraceIndex
+
+        if self.header is None:
+            return None
+        pos = self._file.tell()
+        try:
+            end = self._file.seek(0, io.SEEK_END)
+            if end < _TRAILER.size:
+                return None
+            self._file.seek(end - _TRAILER.size)
+            offset, magic = _TRAILER.unpack(self._file.read(_TRAILER.size))
+            if magic != FOOTER_MAGIC or offset >= end:
+                return None
+            self._file.seek(offset)
+            if self._file.read(1) != bytes([3]):
+                return None
+            index = TraceIndex.read_footer(
+                self._file, os.fstat(self._file.fileno()).st_size)
+            # From version 2 the footer leaves the function table to
+            # the header
+            index.function_names.update(self.function_names)
+            return index
+        finally:
+            self._file.seek(pos)
+
+    def _open_mmap(self):
+        start = self._file.tell()
+        self._file.seek(0, 2)
+        if self._file.tell() == 0:
+            # mmap refuses to map an empty file
+            self._view = memoryview(b'')
+        else:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+        self._file.seek(start)
+        self._offset = start
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Payload views handed out to the caller are still
+                # alive, the mapping goes away when they do
+                pass
+            self._mmap = None
+        self._file.close()
+
+    def _read(self, size):
+        if self._view is None:
+            return self._file.read(size)
+        start = self._offset
+        self._offset += size
+        return self._view[start:self._offset]
+
+    def _unpack(self, st):
+        if self._view is None:
+            return st.unpack(self._file.read(st.size))
+        values = st.unpack_from(self._view, self._offset)
+        self._offset += st.size
+        return values
+
+    def _tell(self):
+        if self._view is None:
+            return self._file.tell()
+        return self._offset
+
+    def _seek(self, offset):
+        if self._view is None:
+            self._file.seek(offset)
+        else:
+            self._offset = offset
+
+    def _skip(self, size):
+        if self._view is None:
+            self._file.seek(size, 1)
+        else:
+            self._offset += size
+
+    def _require_index(self):
+        if self.index is None:
+            # trace_index imports this module
+            from pumpkinpy.trace_index import build_index
+
+            self._set_index(build_index(self._path))
+
+    def seek(self, offset, call_index=0):
+        """Position the reader at a message.
+
+        offset must be that of a message's tag byte, as found by scan()
+        or an index, and call_index the index of the next call there.
+        Function IDs declared before offset have to be set with
+        set_function_names() first.
+        """
+        self._seek(offset)
+        self.call_index = call_index
+
+    def seek_call(self, call_index):
+        """Position the reader so the next read() returns that call."""
+        self._require_index()
+        self.seek(self.index.offsets[call_index], call_index)
+
+    def seek_frame(self, frame_index):
+        """Position the reader at the first call of a frame."""
+        self._require_index()
+        self.seek_call(self.index.frame_starts[frame_index])
+
+    def read_reversed(self):
+        """Yield calls from the last one back to the first.
+
+        Like read(), calls to functions that aren't traced with a body
+        come back as None.
+        """
+        self._require_index()
+        for call_index in reversed(range(len(self.index))):
+            self.seek_call(call_index)
+            yield self.read()
+
+    def scan(self):
+        """Walk the call messages without decoding them.
+
+        Yields (offset, dyn_id, size) per call, where offset is that
+        of the message's tag byte and dyn_id the function ID used in
+        this trace, see function_names.
+        """
+        while True:
+            offset = self._tell()
+            buf = self._read(1)
+            if len(buf) == 0 or buf[0] == 3:
+                return
+            elif buf[0] == 1:
+                self.read_function_id()
+            elif buf[0] == 2:
+                dyn_id, size = self._unpack(_CALL_HEADER)
+                self._skip(size)
+                self.call_index += 1
+                yield offset, dyn_id, size
+            else:
+                raise ValueError('invalid message type')
+
+    def select(self, wanted, stop=None):
+        """Yield only the calls to wanted functions.
+
+        wanted is either a collection of function names or a predicate
+        that takes a Function. Calls to other functions are skipped
+        using the size in their header without being decoded, and so
+        are calls that would read() as None. If stop is given, reading
+        ends before the call with that index.
+        """
+        if not callable(wanted):
+            names = frozenset(wanted)
+            wanted = lambda func: func.name in names
+        # Whether each function ID in the trace is wanted
+        matches = {}
+        while self.call_index != stop:
+            buf = self._read(1)
+            if len(buf) == 0 or buf[0] == 3:
+                return
+            elif buf[0] == 1:
+                self.read_function_id()
+            elif buf[0] == 2:
+                dyn_id, size = self._unpack(_CALL_HEADER)
+                match = matches.get(dyn_id)
+                if match is None:
+                    func, decoder = self._function_map[dyn_id]
+                    match = decoder is not None and bool(wanted(func))
+                    matches[dyn_id] = match
+                if match:
+                    yield self._decode_call(dyn_id, size)
+                else:
+                    self._skip(size)
+                    self.call_index += 1
+            else:
+                raise ValueError('invalid message type')
 
     def read(self):
-        buf = self._file.read(1)
-        if len(buf) == 0:
+        buf = self._read(1)
+        if len(buf) == 0 or buf[0] == 3:
             raise StopIteration
         elif buf[0] == 1:
             self.read_function_id()
@@ -45,69 +362,55 @@ class TraceReader:
             raise ValueError('invalid message type')
 
     def read_function_id(self):
-        header = struct.Struct('<HB')
-        buf = self._file.read(header.size)
-        dyn_id, name_len = header.unpack(buf)
-        name = self._file.read(name_len).decode('utf-8')
-        for func in glmeta.FUNCTIONS:
-            if func.name == name:
-                func_id = func.function_id
-                break
-        self._function_map[dyn_id] = func_id
+        dyn_id, name_len = self._unpack(_FUNCTION_ID_HEADER)
+        name = str(self._read(name_len), 'utf-8')
+        self._set_function_id(dyn_id, name)
+
+    def set_function_names(self, function_names):
+        """Declare function IDs, as if their messages had been read."""
+        for dyn_id, name in function_names.items():
+            self._set_function_id(dyn_id, name)
+
+    def _set_function_id(self, dyn_id, name):
+        self.function_names[dyn_id] = name
+        # Resolved again on next use
+        self._function_map.pop(dyn_id, None)
 
     def read_call(self):
-        header = struct.Struct('<HQ')
-        buf = self._file.read(header.size)
-        dyn_id, size = header.unpack(buf)
-        func = glmeta.FUNCTIONS[self._function_map[dyn_id] - 1]
+        dyn_id, size = self._unpack(_CALL_HEADER)
+        return self._decode_call(dyn_id, size)
 
-        if not func.is_replayable():
-            return
+    def _decode_call(self, dyn_id, size):
+        self.call_index += 1
+        func, decoder = self._function_map[dyn_id]
 
-        fmt = '<'
-        field_names = []
-        # Add return value
-        if func.has_return():
-            fmt += py_struct_type(func.return_type.stype)
-            field_names.append('return_value')
-        # Add parameters
-        for param in func.params:
-            if param.array:
-                field_names += [f'{param.name}_length', param.name]
-                fmt += 'QQ'
-            elif param.offset:
-                field_names.append(param.name)
-                fmt += 'Q'
-            elif param.ptype.stype:
-                field_names.append(param.name)
-                fmt += py_struct_type(param.ptype.stype)
-            else:
-                raise RuntimeError()
-        body = struct.Struct(fmt)
-        buf = self._file.read(body.size)
-        field_values = body.unpack(buf)
+        if decoder is None:
+            # Not traced with a body, but skip whatever is there
+            self._skip(size)
+            return
 
-        call = Call(func, dict(zip(field_names, field_values)))
-        if 'return_value' in call.fields:
-            call.return_value = call.fields['return_value']
+        fields = dict(zip(decoder.field_names, self._unpack(decoder.body)))
+        call = Call(func, fields, size=size)
+        if decoder.has_return:
+            call.return_value = fields['return_value']
 
         if func.custom_io:
             if func.name == 'glShaderSource':
                 return self.read_shader_source(call)
 
-        for param in func.params:
-            if not param.array:
-                continue
-
-            length = call.fields[f'{param.name}_length']
+        for array in decoder.arrays:
+            length = fields[array.length_field]
             if length == 0:
-                call.fields[param.name] = None
-            elif param.array in ('uint8_t', 'char'):
-                call.fields[param.name] = self._file.read(length)
+                fields[array.name] = None
+            elif array.elem is None:
+                fields[array.name] = self._read(length)
+            elif self._numpy_arrays:
+                buf = self._read(array.elem.size * length)
+                fields[array.name] = numpy.frombuffer(buf, array.dtype)
             else:
-                elem = struct.Struct(py_struct_type(param.array))
-                buf = self._file.read(elem.size * length)
-                call.fields[param.name] = list(item[0] for item in elem.iter_unpack(buf))
+                buf = self._read(array.elem.size * length)
+                fields[array.name] = [item[0] for item in
+                                      array.elem.iter_unpack(buf)]
 
         return call
 
@@ -115,12 +418,12 @@ class TraceReader:
         count = call.fields['count']
         if count > 0:
             elem = struct.Struct('i')
-            buf = self._file.read(count * elem.size)
+            buf = self._read(count * elem.size)
             lengths = [length[0] for length in list(elem.iter_unpack(buf))]
 
             source = ''
             for length in lengths:
-                source += self._file.read(length).decode('utf-8')
+                source += str(self._read(length), 'utf-8')
 
             call.fields['source'] = source
         return call
@@ -0,0 +1,223 @@
+"""Summarize what is in a binary trace.
+
+Reports per-function call counts and payload bytes, calls per frame,
+the largest uploads and how draw calls relate to state changes. Only
+the call headers are read, and memory use doesn't depend on the length
+of the trace.
+
+    python3 -m pumpkinpy.trace_stats [--json] [--top N] trace
+"""
+
+import argparse
+import heapq
+import json
+import math
+import sys
+
+import attr
+
+from pumpkinpy.trace_reader import TraceReader
+
+# TODO
+sys.path.append('build')
+import glmeta
+
+
+@attr.s
+class RunningStats:
+    """Count, mean, deviation and range of a stream of values."""
+    count = attr.ib(default=0)
+    mean = attr.ib(default=0.0)
+    # Sum of squared differences from the mean (Welford)
+    m2 = attr.ib(default=0.0)
+    minimum = attr.ib(default=None)
+    maximum = attr.ib(default=None)
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    @property
+    def stdev(self):
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def to_json(self):
+        return {'count': self.count, 'mean': self.mean, 'stdev': self.stdev,
+                'min': self.minimum, 'max': self.maximum}
+
+
+@attr.s
+class FunctionStats:
+    calls = attr.ib(default=0)
+    bytes = attr.ib(default=0)
+
+
+@attr.s
+class Upload:
+    size = attr.ib()
+    call_index = attr.ib()
+    frame = attr.ib()
+    name = attr.ib()
+
+
+class TraceStats:
+    def __init__(self, top=10):
+        self.top = top
+        self.num_calls = 0
+        self.num_bytes = 0
+        self.num_draws = 0
+        self.num_state_changes = 0
+        # Function name -> FunctionStats
+        self.functions = {}
+        self.calls_per_frame = RunningStats()
+        self.draws_per_frame = RunningStats()
+        # Min-heap of (size, call index, frame, name)
+        self._uploads = []
+        self._frame = 0
+        self._frame_calls = 0
+        self._frame_draws = 0
+
+    def scan(self, reader):
+        # Per function ID in the trace: (name, FunctionStats, is
+        # upload, is draw, is state change, is swap)
+        kinds = {}
+        for _, dyn_id, size in reader.scan():
+            kind = kinds.get(dyn_id)
+            if kind is None:
+                func = glmeta.FUNCTIONS_BY_NAME[reader.function_names[dyn_id]]
+                stats = self.functions.setdefault(func.name, FunctionStats())
+                kind = (func.name, stats, func.is_upload(),
+                        func.is_draw(), func.is_state_change(),
+                        func.is_swap_buffers())
+                kinds[dyn_id] = kind
+            name, stats, is_upload, is_draw, is_state_change, is_swap = kind
+
+            stats.calls += 1
+            stats.bytes += size
+            self.num_calls += 1
+            self.num_bytes += size
+            self._frame_calls += 1
+            if is_draw:
+                self.num_draws += 1
+                self._frame_draws += 1
+            elif is_state_change:
+                self.num_state_changes += 1
+            elif is_upload and size:
+                self._add_upload(size, reader.call_index - 1, name)
+            if is_swap:
+                self._end_frame()
+        if self._frame_calls:
+            # Calls after the last swap
+            self._end_frame()
+
+    def _add_upload(self, size, call_index, name):
+        if self.top <= 0:
+            return
+        upload = (size, call_index, self._frame, name)
+        if len(self._uploads) < self.top:
+            heapq.heappush(self._uploads, upload)
+        elif size > self._uploads[0][0]:
+            heapq.heapreplace(self._uploads, upload)
+
+    def _end_frame(self):
+        self.calls_per_frame.add(self._frame_calls)
+        self.draws_per_frame.add(self._frame_draws)
+        self._frame += 1
+        self._frame_calls = 0
+        self._frame_draws = 0
+
+    @property
+    def num_frames(self):
+        return self.calls_per_frame.count
+
+    def uploads(self):
+        """The largest uploads, biggest first."""
+        uploads = sorted(self._uploads, key=lambda upload: (-upload[0],
+                                                            upload[1]))
+        return [Upload(*upload) for upload in uploads]
+
+    def state_changes_per_draw(self):
+        if self.num_draws == 0:
+            return None
+        return self.num_state_changes / self.num_draws
+
+
+def to_json(stats, uploads):
+    return {
+        'calls': stats.num_calls,
+        'bytes': stats.num_bytes,
+        'frames': stats.num_frames,
+        'draws': stats.num_draws,
+        'state_changes': stats.num_state_changes,
+        'state_changes_per_draw': stats.state_changes_per_draw(),
+        'calls_per_frame': stats.calls_per_frame.to_json(),
+        'draws_per_frame': stats.draws_per_frame.to_json(),
+        'functions': {name: attr.asdict(func)
+                      for name, func in stats.functions.items()},
+        'largest_uploads': [attr.asdict(upload) for upload in uploads],
+    }
+
+
+def print_text(stats, uploads):
+    print('{} calls, {} bytes, {} frames'.format(
+        stats.num_calls, stats.num_bytes, stats.num_frames))
+    for label, running in (('calls', stats.calls_per_frame),
+                           ('draws', stats.draws_per_frame)):
+        print('{} per frame: mean {:.1f}, stdev {:.1f}, min {}, max {}'.format(
+            label, running.mean, running.stdev, running.minimum,
+            running.maximum))
+    ratio = stats.state_changes_per_draw()
+    print('{} draws, {} state changes ({} per draw)'.format(
+        stats.num_draws, stats.num_state_changes,
+        'n/a' if ratio is None else '{:.2f}'.format(ratio)))
+
+    print()
+    print('{:>10} {:>14}  {}'.format('calls', 'bytes', 'function'))
+    for name, func in sorted(stats.functions.items(),
+                             key=lambda item: (-item[1].calls, item[0])):
+        print('{:10} {:14}  {}'.format(func.calls, func.bytes, name))
+
+    if uploads:
+        print()
+        print('{:>14} {:>10} {:>8}  {}'.format('bytes', 'call', 'frame',
+                                               'function'))
+        for upload in uploads:
+            print('{:14} {:10} {:8}  {}'.format(
+                upload.size, upload.call_index, upload.frame, upload.name))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Summarize the calls in a trace.')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of largest uploads to list, 0 for none')
+    parser.add_argument('trace')
+    args = parser.parse_args()
+
+    stats = TraceStats(args.top)
+    # Not memory-mapped, the mapped pages would count against the
+    # process's resident size
+    reader = TraceReader(args.trace)
+    stats.scan(reader)
+    reader.close()
+    uploads = stats.uploads()
+
+    if args.json:
+        json.dump(to_json(stats, uploads), sys.stdout, indent=2)
+        print()
+    else:
+        print_text(stats, uploads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import platform
+import struct
+import sys
+
+from pumpkinpy.trace_index import TraceIndex
+from pumpkinpy.trace_reader import FOOTER_MAGIC, MAGIC, VERSION
+
+# TODO
+sys.path.append('build')
+import glmeta
+
+_TRACE_HEADER = struct.Struct('<4sHBB')
+_NUM_FUNCTIONS = struct.Struct('<H')
+_FUNCTION_ID_HEADER = struct.Struct('<HB')
+_CALL_HEADER = struct.Struct('<BHQ')
+_TRAILER = struct.Struct('<Q4s')
+_SHADER_LENGTH = struct.Struct('<i')
+
+
+class TraceWriter:
+    """Write calls in the binary trace format.
+
+    This produces the same messages as the tracer, including the
+    header and, on close(), the footer. It's used to synthesize traces
+    for benchmarks and to rewrite existing traces.
+
+    The platform recorded in the header defaults to the current one.
+    Like the tracer it declares every function glmeta knows in the
+    header, with its function_id as ID.
+    """
+    def __init__(self, path, platform_name=None):
+        self._file = open(path, 'wb')
+        # Collects the footer, whose function table stays empty
+        self._index = TraceIndex()
+        self._new_frame = True
+        # Indexed by function ID for every call
+        self._decoders = tuple(glmeta.DECODERS)
+
+        if platform_name is None:
+            platform_name = '{} {}'.format(platform.system(),
+                                           platform.machine())
+        platform_name = platform_name.encode('utf-8')
+        self._file.write(_TRACE_HEADER.pack(MAGIC, VERSION,
+                                            struct.calcsize('P'),
+                                            len(platform_name)))
+        self._file.write(platform_name)
+
+        self._file.write(_NUM_FUNCTIONS.pack(len(glmeta.FUNCTIONS)))
+        for func in glmeta.FUNCTIONS:
+            name = func.name.encode('utf-8')
+            self._file.write(_FUNCTION_ID_HEADER.pack(func.function_id,
+                                                      len(name)))
+            self._file.write(name)
+
+    def close(self):
+        offset = self._file.tell()
+        self._file.write(bytes([3]))
+        self._index.write_footer(self._file)
+        self._file.write(_TRAILER.pack(offset, FOOTER_MAGIC))
+        self._file.close()
+
+    def write_call(self, name, **fields):
+        """Write one call.
+
+        Scalar params are passed by name. Array params can be bytes
+        or a sequence of elements, their length fields are filled in
+        automatically. glShaderSource takes its text as "source".
+        """
+        func = glmeta.FUNCTIONS_BY_NAME[name]
+        body = self.encode_body(func, fields)
+        if self._new_frame:
+            self._index.frame_starts.append(len(self._index))
+            self._new_frame = False
+        self._index.offsets.append(self._file.tell())
+        self._index.function_ids.append(func.function_id)
+        self._index.sizes.append(len(body))
+        self._new_frame = func.is_swap_buffers()
+
+        self._file.write(_CALL_HEADER.pack(2, func.function_id, len(body)))
+        self._file.write(body)
+
+    def encode_body(self, func, fields):
+        decoder = self._decoders[func.function_id]
+        if decoder is None or func.is_empty():
+            return b''
+
+        fields = dict(fields)
+        payloads = []
+        for array in decoder.arrays:
+            value = fields.get(array.name)
+            if value is None:
+                data = b''
+                length = 0
+            elif array.elem is None:
+                data = bytes(value)
+                length = len(data)
+            else:
+                length = len(value)
+                data = struct.pack('<{}{}'.format(
+                    length, array.elem.format[-1]), *value)
+            fields[array.length_field] = length
+            fields[array.name] = 0
+            payloads.append(data)
+
+        if func.name == 'glShaderSource':
+            source = fields.pop('source').encode('utf-8') + b'\0'
+            fields['count'] = 1
+            payloads.append(_SHADER_LENGTH.pack(len(source)))
+            payloads.append(source)
+
+        values = (fields.get(name, 0) for name in decoder.field_names)
+        return decoder.body.pack(*values) + b''.join(payloads)
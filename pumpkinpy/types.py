@@ -1,3 +1,5 @@
+import time
+
 import attr
 
 @attr.s
@@ -43,6 +45,8 @@ class Function:
     no_replay = attr.ib(default=False)
     custom_io = attr.ib(default=False)
     trace_append = attr.ib(default=False)
+    # Name of the explode.py handler for calls to this function
+    explode = attr.ib(default=None)
 
     def param(self, name):
         for param in self.params:
@@ -90,6 +94,33 @@ class Function:
     def is_empty(self):
         return not self.params and not self.has_return()
 
+    def is_swap_buffers(self):
+        return self.name in ('glXSwapBuffers',
+                             'eglSwapBuffers',
+                             'eglSwapBuffersWithDamageEXT',
+                             'eglSwapBuffersWithDamageKHR')
+
+    def is_draw(self):
+        return self.name.startswith(('glDraw', 'glMultiDraw'))
+
+    def is_upload(self):
+        """Whether this sends buffer or texture data that is traced."""
+        return self.has_array_params() and self.name.startswith((
+            'glBufferData', 'glBufferStorage', 'glBufferSubData',
+            'glCompressedTexImage', 'glCompressedTexSubImage',
+            'glCompressedTextureSubImage', 'glNamedBufferData',
+            'glNamedBufferStorage', 'glNamedBufferSubData', 'glTexImage',
+            'glTexSubImage', 'glTextureSubImage'))
+
+    def is_state_change(self):
+        return self.name.startswith((
+            'glActiveTexture', 'glBind', 'glBlend', 'glClearColor',
+            'glClearDepth', 'glClearStencil', 'glColorMask', 'glCullFace',
+            'glDepth', 'glDisable', 'glEnable', 'glFrontFace',
+            'glLineWidth', 'glPixelStore', 'glPolygon', 'glSampleCoverage',
+            'glScissor', 'glStencil', 'glTexParameter', 'glUniform',
+            'glUseProgram', 'glVertexAttrib', 'glViewport'))
+
 
 class Source:
     def __init__(self):
@@ -118,3 +149,45 @@ class Source:
     def write(self, path):
         with open(path, 'w') as wfile:
             wfile.write(self.text())
+
+
+class StreamingSource:
+    """Lines of generated text written to a file as they are added.
+
+    Unlike Source the text is never held in memory as a whole, so
+    memory use doesn't grow with the number of lines, and lines can
+    only be appended. The file is flushed at most every flush_interval
+    seconds (checked every few thousand lines) so the output shows up
+    while it is being produced and survives if the producer dies.
+    close() writes out the remaining lines.
+    """
+    _FLUSH_CHECK_LINES = 4096
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self._lines = []
+        self._file = open(path, 'w')
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def add(self, item):
+        if isinstance(item, str):
+            self._lines.append(item)
+        else:
+            self._lines += item
+        if len(self._lines) >= self._FLUSH_CHECK_LINES:
+            self._write_lines()
+
+    def _write_lines(self):
+        self._file.write('\n'.join(self._lines))
+        self._file.write('\n')
+        self._lines = []
+        now = time.monotonic()
+        if now - self._last_flush >= self._flush_interval:
+            self._file.flush()
+            self._last_flush = now
+
+    def close(self):
+        if self._lines:
+            self._write_lines()
+        self._file.close()
@@ -0,0 +1,74 @@
+#include "pumpkintown/blob_archive.hh"
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <fstream>
+#include <stdexcept>
+#include <string>
+
+namespace pumpkintown {
+
+BlobArchive::BlobArchive(const Path& dir) {
+  Path table_path{dir};
+  std::ifstream table{table_path.append("blobs.table").value(),
+                      std::ios::binary};
+  if (!table.is_open()) {
+    throw std::runtime_error("file not found: blobs.table");
+  }
+  // The table is little-endian (offset, length) pairs
+  Entry entry;
+  while (table.read(reinterpret_cast<char*>(&entry), sizeof(entry))) {
+    table_.push_back(entry);
+  }
+
+  Path data_path{dir};
+  const auto path{data_path.append("blobs.pack").value()};
+  const int fd{open(path.c_str(), O_RDONLY)};
+  if (fd == -1) {
+    throw std::runtime_error("file not found: " + path);
+  }
+  struct stat st;
+  if (fstat(fd, &st) != 0) {
+    close(fd);
+    throw std::runtime_error("fstat failed: " + path);
+  }
+  data_size_ = st.st_size;
+  if (data_size_ > 0) {
+    void* addr{mmap(nullptr, data_size_, PROT_READ, MAP_PRIVATE, fd, 0)};
+    if (addr == MAP_FAILED) {
+      close(fd);
+      throw std::runtime_error("mmap failed: " + path);
+    }
+    data_ = static_cast<const uint8_t*>(addr);
+  }
+  // The mapping stays valid after the file is closed
+  close(fd);
+}
+
+BlobArchive::~BlobArchive() {
+  if (data_) {
+    munmap(const_cast<uint8_t*>(data_), data_size_);
+  }
+}
+
+const BlobArchive::Entry& BlobArchive::entry(const uint64_t index) const {
+  const auto& entry{table_.at(index)};
+  if (entry.offset + entry.length > data_size_) {
+    throw std::runtime_error("blob " + std::to_string(index) +
+                             " is out of bounds");
+  }
+  return entry;
+}
+
+const uint8_t* BlobArchive::data(const uint64_t index) const {
+  return data_ + entry(index).offset;
+}
+
+uint64_t BlobArchive::size(const uint64_t index) const {
+  return entry(index).length;
+}
+
+}
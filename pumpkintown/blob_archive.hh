@@ -0,0 +1,40 @@
+#ifndef PUMPKINTOWN_BLOB_ARCHIVE_HH_
+#define PUMPKINTOWN_BLOB_ARCHIVE_HH_
+
+#include <cstdint>
+#include <vector>
+
+#include "pumpkintown/path.hh"
+
+namespace pumpkintown {
+
+// Payloads packed by "explode.py --pack". The data file is mapped
+// read-only and blobs are handed out as pointers into the mapping.
+class BlobArchive {
+ public:
+  // Opens blobs.pack and blobs.table in |dir|.
+  explicit BlobArchive(const Path& dir);
+  ~BlobArchive();
+
+  BlobArchive(const BlobArchive&) = delete;
+  BlobArchive& operator=(const BlobArchive&) = delete;
+
+  const uint8_t* data(uint64_t index) const;
+  uint64_t size(uint64_t index) const;
+
+ private:
+  struct Entry {
+    uint64_t offset;
+    uint64_t length;
+  };
+
+  const Entry& entry(uint64_t index) const;
+
+  std::vector<Entry> table_;
+  const uint8_t* data_{nullptr};
+  uint64_t data_size_{0};
+};
+
+}
+
+#endif  // PUMPKINTOWN_BLOB_ARCHIVE_HH_
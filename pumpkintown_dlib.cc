@@ -2,6 +2,7 @@
 
 #include <cstdio>
 #include <cstdlib>
+#include <mutex>
 #include <stdexcept>
 
 #include <dlfcn.h>
@@ -55,12 +56,14 @@ namespace pumpkintown {
 
 Serialize* serialize() {
   static Serialize s;
-  if (!s.is_open()) {
+  // Opened once, even if the first calls come from several threads
+  static std::once_flag opened;
+  std::call_once(opened, [] {
     if (!s.open("trace")) {
       // TODO
       fprintf(stderr, "failed to open trace file\n");
     }
-  }
+  });
   return &s;
 }
 
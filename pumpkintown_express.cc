@@ -215,8 +215,7 @@ void Express::make_context_current() {
 
 void Express::shader_source() {
   const auto shader{vars_.at(arg(0)).as_uint32()};
-  const GLchar* src = reinterpret_cast<const char*>(
-      uint8_arrays_[arg(1)].data());
+  const GLchar* src = reinterpret_cast<const char*>(uint8_array(arg(1)));
   glShaderSource(shader, 1, &src, nullptr);
 }
 
@@ -300,16 +299,26 @@ void Express::capture_fb(const std::string& path) {
 }
 
 void Express::load_array() {
-#define LOAD_ARRAY(map_, type_, conv_)              \
-  map_[name] = std::vector<type_>();                \
-  auto& vec = map_[name];                           \
-  vec.resize(iter_.args().size() - 2);              \
-  for (size_t i{2}; i < iter_.args().size(); i++) { \
-    vec[i - 2] = conv_(arg(i));                     \
+#define LOAD_ARRAY(map_, type_, conv_)                       \
+  map_[name] = std::vector<type_>();                         \
+  auto& vec = map_[name];                                    \
+  if (binary) {                                              \
+    vec.resize(uint8_array_size(arg(2)) / sizeof(type_));    \
+    memcpy(vec.data(), uint8_array(arg(2)),                  \
+           vec.size() * sizeof(type_));                      \
+  } else {                                                   \
+    vec.resize(iter_.args().size() - 2);                     \
+    for (size_t i{2}; i < iter_.args().size(); i++) {        \
+      vec[i - 2] = conv_(arg(i));                            \
+    }                                                        \
   }
 
   const auto& name = arg(0);
   const auto& type = arg(1);
+  // Large arrays are stored as a blob of little-endian values
+  const bool binary{iter_.args().size() == 3 &&
+                    (arg(2).substr(0, 5) == "file:" ||
+                     arg(2).substr(0, 5) == "pack:")};
   if (type == "float") {
     LOAD_ARRAY(float_arrays_, float, to_float);
   } else if (type == "char") {
@@ -324,6 +333,27 @@ void Express::load_array() {
 #undef LOAD_ARRAY
 }
 
+BlobArchive& Express::archive() {
+  if (!archive_) {
+    archive_.reset(new BlobArchive(dir_));
+  }
+  return *archive_;
+}
+
+const uint8_t* Express::uint8_array(const std::string& name) {
+  if (name.substr(0, 5) == "pack:") {
+    return archive().data(std::stoull(name.substr(5)));
+  }
+  return uint8_arrays_.at(name).data();
+}
+
+uint64_t Express::uint8_array_size(const std::string& name) {
+  if (name.substr(0, 5) == "pack:") {
+    return archive().size(std::stoull(name.substr(5)));
+  }
+  return uint8_arrays_.at(name).size();
+}
+
 const void* Express::to_offset(const std::string& str) {
   std::istringstream iss{str};
   uint64_t val;
@@ -3,8 +3,10 @@
 
 #include <cstdint>
 #include <map>
+#include <memory>
 #include <string>
 
+#include "pumpkintown/blob_archive.hh"
 #include "pumpkintown/path.hh"
 #include "pumpkintown/text_trace_iterator.hh"
 #include "pumpkintown_any.hh"
@@ -37,6 +39,12 @@ class Express {
 
   void load_array();
 
+  BlobArchive& archive();
+
+  // Data and size of a "file:NAME" or "pack:INDEX" argument
+  const uint8_t* uint8_array(const std::string& name);
+  uint64_t uint8_array_size(const std::string& name);
+
   const void* to_offset(const std::string& str);
   char to_char(const std::string& str);
   float to_float(const std::string& str);
@@ -62,6 +70,7 @@ class Express {
   std::map<std::string, std::vector<int32_t>> int32_arrays_;
   std::map<std::string, std::vector<uint8_t>> uint8_arrays_;
   std::map<std::string, std::vector<uint32_t>> uint32_arrays_;
+  std::unique_ptr<BlobArchive> archive_;
 
   Path dir_;
 };
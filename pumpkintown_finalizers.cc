@@ -175,16 +175,6 @@ void FnGlBindAttribLocation::finalize() {
   name_length = strlen(name) + 1;
 }
 
-FnGlShaderSource::~FnGlShaderSource() {
-  if (string) {
-    for (int32_t i{0}; i < count; i++) {
-      delete[] string[i];
-    }
-  }
-  delete[] string;
-  delete[] length;
-}
-
 static std::vector<int32_t> gl_shader_source_lengths(
     const int32_t count,
     const int32_t* length,
@@ -220,35 +210,42 @@ std::string FnGlShaderSource::to_string() const {
   return result;
 }
 
-void FnGlShaderSource::read_from_file(FILE* f) {
-  read_exact(f, this, sizeof(*this));
-  if (count > 0) {
-    auto length_tmp = new int32_t[count];
-    read_exact(f, length_tmp, count * sizeof(*length_tmp));
-    length = length_tmp;
-
-    auto string_tmp = new char*[count];
-    for (int32_t i{0}; i < count; i++) {
-      string_tmp[i] = new char[length[i]];
-      read_exact(f, string_tmp[i], length[i]);
-    }
-    string = string_tmp;
-  } else {
-    length = nullptr;
-    string = nullptr;
+void FnGlShaderSource::read_from_buffer(const uint8_t* buf,
+                                        const uint64_t num_bytes,
+                                        CallStorage* storage) {
+  if (num_bytes < sizeof(*this)) {
+    throw std::runtime_error("truncated call");
+  }
+  memcpy(this, buf, sizeof(*this));
+  uint64_t offset{sizeof(*this)};
+  const uint64_t num_strings = count > 0 ? count : 0;
+  length = read_array<int32_t>(buf, num_bytes, &offset, num_strings,
+                               storage);
+
+  // The strings stay in buf, only the pointers to them need a home
+  const char** strings{nullptr};
+  if (num_strings) {
+    strings = static_cast<const char**>(
+        storage->allocate(num_strings * sizeof(*strings)));
+  }
+  for (uint64_t i{0}; i < num_strings; i++) {
+    const char* str{read_array<char>(buf, num_bytes, &offset,
+                                     length[i] > 0 ? length[i] : 0,
+                                     storage)};
+    strings[i] = str ? str : "";
   }
+  string = strings;
 }
 
-void FnGlShaderSource::write_to_file(FILE* f) {
-  write_exact(f, this, sizeof(*this));
+void FnGlShaderSource::write_to_buffer(std::vector<uint8_t>* buf) const {
+  append_bytes(buf, this, sizeof(*this));
 
   const auto real_lengths = gl_shader_source_lengths(count, length, string);
 
-  write_exact(f, real_lengths.data(), count * sizeof(int32_t));
+  append_bytes(buf, real_lengths.data(), count * sizeof(int32_t));
   for (int32_t i{0}; i < count; i++) {
-    write_exact(f, string[i], real_lengths[i]);
+    append_bytes(buf, string[i], real_lengths[i]);
   }
-  fflush(f);
 }
 
 }
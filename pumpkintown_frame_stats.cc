@@ -0,0 +1,98 @@
+#include "pumpkintown_frame_stats.hh"
+
+#include <algorithm>
+#include <cmath>
+
+namespace pumpkintown {
+
+void FrameStats::start() {
+  start_ = Clock::now();
+  frame_start_ = start_;
+  end_ = start_;
+}
+
+void FrameStats::end_frame() {
+  const auto now = Clock::now();
+  const std::chrono::duration<double, std::milli> elapsed{now - frame_start_};
+  frame_ms_.push_back(elapsed.count());
+  frame_calls_.push_back(num_calls_ - frame_start_call_);
+  frame_start_ = now;
+  frame_start_call_ = num_calls_;
+}
+
+void FrameStats::finish() {
+  end_ = Clock::now();
+}
+
+double FrameStats::total_seconds() const {
+  return std::chrono::duration<double>{end_ - start_}.count();
+}
+
+double FrameStats::percentile(const std::vector<double>& sorted,
+                              const double p) {
+  if (sorted.empty()) {
+    return 0;
+  }
+  // Nearest rank
+  const auto rank = static_cast<size_t>(std::ceil(p / 100 * sorted.size()));
+  return sorted[std::max<size_t>(rank, 1) - 1];
+}
+
+void FrameStats::print_summary(FILE* f) const {
+  std::vector<double> sorted{frame_ms_};
+  std::sort(sorted.begin(), sorted.end());
+  const double seconds{total_seconds()};
+
+  fprintf(f, "%zu frames, %llu calls in %.3f s: %.0f calls/s\n",
+          sorted.size(), static_cast<unsigned long long>(num_calls_),
+          seconds, seconds > 0 ? num_calls_ / seconds : 0.0);
+  fprintf(f, "frame ms: min %.3f  median %.3f  p95 %.3f  p99 %.3f  "
+          "max %.3f\n",
+          percentile(sorted, 0), percentile(sorted, 50),
+          percentile(sorted, 95), percentile(sorted, 99),
+          percentile(sorted, 100));
+}
+
+bool FrameStats::write_csv(const std::string& path) const {
+  FILE* f{fopen(path.c_str(), "w")};
+  if (!f) {
+    return false;
+  }
+  fprintf(f, "frame,calls,ms\n");
+  for (size_t i{0}; i < frame_ms_.size(); i++) {
+    fprintf(f, "%zu,%llu,%.6f\n", i,
+            static_cast<unsigned long long>(frame_calls_[i]), frame_ms_[i]);
+  }
+  return fclose(f) == 0;
+}
+
+bool FrameStats::write_json(const std::string& path) const {
+  FILE* f{fopen(path.c_str(), "w")};
+  if (!f) {
+    return false;
+  }
+  std::vector<double> sorted{frame_ms_};
+  std::sort(sorted.begin(), sorted.end());
+  const double seconds{total_seconds()};
+
+  fprintf(f, "{\n");
+  fprintf(f, "  \"frames\": %zu,\n", frame_ms_.size());
+  fprintf(f, "  \"calls\": %llu,\n",
+          static_cast<unsigned long long>(num_calls_));
+  fprintf(f, "  \"seconds\": %.6f,\n", seconds);
+  fprintf(f, "  \"calls_per_second\": %.1f,\n",
+          seconds > 0 ? num_calls_ / seconds : 0.0);
+  fprintf(f, "  \"frame_ms\": {\"min\": %.6f, \"median\": %.6f, "
+          "\"p95\": %.6f, \"p99\": %.6f, \"max\": %.6f},\n",
+          percentile(sorted, 0), percentile(sorted, 50),
+          percentile(sorted, 95), percentile(sorted, 99),
+          percentile(sorted, 100));
+  fprintf(f, "  \"frame_times_ms\": [");
+  for (size_t i{0}; i < frame_ms_.size(); i++) {
+    fprintf(f, "%s%.6f", i ? ", " : "", frame_ms_[i]);
+  }
+  fprintf(f, "]\n}\n");
+  return fclose(f) == 0;
+}
+
+}
@@ -0,0 +1,54 @@
+#ifndef PUMPKINTOWN_FRAME_STATS_HH_
+#define PUMPKINTOWN_FRAME_STATS_HH_
+
+#include <chrono>
+#include <cstdint>
+#include <cstdio>
+#include <string>
+#include <vector>
+
+namespace pumpkintown {
+
+// Collects the wall time of every frame of a replay. A frame ends
+// when its swap call returns, the first one starts with start().
+class FrameStats {
+ public:
+  void start();
+
+  void add_call() { num_calls_++; }
+
+  void end_frame();
+
+  // Stop the clock, calls after the last swap count towards the
+  // total but not towards any frame
+  void finish();
+
+  // Frame time percentiles and calls per second
+  void print_summary(FILE* f) const;
+
+  // One line per frame: index, calls and milliseconds
+  bool write_csv(const std::string& path) const;
+
+  // The summary and the frame times
+  bool write_json(const std::string& path) const;
+
+ private:
+  using Clock = std::chrono::steady_clock;
+
+  double total_seconds() const;
+
+  // Milliseconds of the frame at percentile p of the sorted times
+  static double percentile(const std::vector<double>& sorted, double p);
+
+  Clock::time_point start_;
+  Clock::time_point frame_start_;
+  Clock::time_point end_;
+  uint64_t num_calls_{0};
+  uint64_t frame_start_call_{0};
+  std::vector<double> frame_ms_;
+  std::vector<uint64_t> frame_calls_;
+};
+
+}
+
+#endif  // PUMPKINTOWN_FRAME_STATS_HH_
@@ -0,0 +1,85 @@
+#include "pumpkintown_gpu_timer.hh"
+
+#include "pumpkintown_gl_enum.hh"
+#include "pumpkintown_gl_functions.hh"
+
+namespace pumpkintown {
+
+GpuTimer::~GpuTimer() {
+  close();
+}
+
+bool GpuTimer::open(const std::string& path) {
+  file_ = fopen(path.c_str(), "w");
+  if (!file_) {
+    return false;
+  }
+  fprintf(file_, "call,frame,function,program,gpu_ns\n");
+  return true;
+}
+
+void GpuTimer::set_context(const void* context) {
+  current_ = &contexts_[context];
+}
+
+void GpuTimer::begin(const uint64_t call_index, const uint64_t frame,
+                     const FunctionId function, const uint32_t program) {
+  GLuint query{0};
+  if (current_->free.empty()) {
+    glGenQueries(1, &query);
+  } else {
+    query = current_->free.back();
+    current_->free.pop_back();
+  }
+  current_->pending.push_back(
+      Pending{query, call_index, frame, function, program});
+  glBeginQuery(GL_TIME_ELAPSED, query);
+}
+
+void GpuTimer::end() {
+  glEndQuery(GL_TIME_ELAPSED);
+}
+
+void GpuTimer::poll() {
+  while (!current_->pending.empty()) {
+    // Queries finish in order, later ones can't be ready either
+    GLint available{0};
+    glGetQueryObjectiv(current_->pending.front().query,
+                       GL_QUERY_RESULT_AVAILABLE, &available);
+    if (!available) {
+      break;
+    }
+    write_result();
+  }
+}
+
+void GpuTimer::finish() {
+  while (!current_->pending.empty()) {
+    write_result();
+  }
+}
+
+void GpuTimer::close() {
+  if (!file_) {
+    return;
+  }
+  finish();
+  fclose(file_);
+  file_ = nullptr;
+}
+
+void GpuTimer::write_result() {
+  const Pending& pending = current_->pending.front();
+  GLuint64 ns{0};
+  glGetQueryObjectui64v(pending.query, GL_QUERY_RESULT, &ns);
+  const char* name{function_name(pending.function)};
+  fprintf(file_, "%llu,%llu,%s,%u,%llu\n",
+          static_cast<unsigned long long>(pending.call_index),
+          static_cast<unsigned long long>(pending.frame),
+          name ? name : "unknown", pending.program,
+          static_cast<unsigned long long>(ns));
+  current_->free.push_back(pending.query);
+  current_->pending.pop_front();
+}
+
+}
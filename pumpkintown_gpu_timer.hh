@@ -0,0 +1,81 @@
+#ifndef PUMPKINTOWN_GPU_TIMER_HH_
+#define PUMPKINTOWN_GPU_TIMER_HH_
+
+#include <cstdint>
+#include <cstdio>
+#include <deque>
+#include <map>
+#include <string>
+#include <vector>
+
+#include "pumpkintown_function_id.hh"
+#include "pumpkintown_gl_types.hh"
+
+namespace pumpkintown {
+
+// Times calls on the GPU with GL_TIME_ELAPSED queries and writes one
+// CSV line per call: call index, frame, function, program and
+// nanoseconds. Results are only read once the GPU has them, so timing
+// doesn't stall the pipeline.
+//
+// Query objects aren't shared between contexts, so every context has
+// its own, and results can only be read while their context is
+// current. Lines come out in call order within each context.
+//
+// Needs desktop GL 3.3 or ARB_timer_query.
+class GpuTimer {
+ public:
+  GpuTimer() = default;
+  ~GpuTimer();
+
+  bool open(const std::string& path);
+
+  // Time calls in context from now on, called whenever the replay
+  // makes a context current
+  void set_context(const void* context);
+
+  // Start timing a call. program is the program in use, as named in
+  // the trace.
+  void begin(uint64_t call_index, uint64_t frame, FunctionId function,
+             uint32_t program);
+
+  void end();
+
+  // Write the current context's results the GPU has finished
+  void poll();
+
+  // Wait for the current context's results and write them
+  void finish();
+
+  // Finish the current context and close the file. Results pending
+  // in other contexts are dropped.
+  void close();
+
+ private:
+  struct Pending {
+    GLuint query;
+    uint64_t call_index;
+    uint64_t frame;
+    FunctionId function;
+    uint32_t program;
+  };
+
+  struct Queries {
+    // In the order the calls were made
+    std::deque<Pending> pending;
+    // Queries whose results have been read
+    std::vector<GLuint> free;
+  };
+
+  // Write the first pending result and recycle its query
+  void write_result();
+
+  FILE* file_{nullptr};
+  std::map<const void*, Queries> contexts_;
+  // The current context's queries
+  Queries* current_{&contexts_[nullptr]};
+};
+
+}
+
+#endif  // PUMPKINTOWN_GPU_TIMER_HH_
@@ -1,9 +1,15 @@
 #include "pumpkintown_io.hh"
 
+#include <cstring>
 #include <sstream>
 #include <stdexcept>
 #include <vector>
 
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
 namespace pumpkintown {
 
 void read_exact(FILE* f, void* dst, uint64_t const num_bytes) {
@@ -32,6 +38,12 @@ void write_exact(FILE* f, const void* src, const uint64_t num_bytes) {
   }
 }
 
+void append_bytes(std::vector<uint8_t>* buf, const void* src,
+                  const uint64_t num_bytes) {
+  const uint8_t* bytes = reinterpret_cast<const uint8_t*>(src);
+  buf->insert(buf->end(), bytes, bytes + num_bytes);
+}
+
 std::string to_string(const void* ptr) {
   std::ostringstream oss;
   oss << ptr;
@@ -39,56 +51,116 @@ std::string to_string(const void* ptr) {
 }
 
 TraceIterator::TraceIterator(const std::string& path) {
-  file_ = fopen(path.c_str(), "rb");
-  if (!file_) {
+  const int fd{open(path.c_str(), O_RDONLY)};
+  if (fd < 0) {
     throw std::runtime_error("open failed");
   }
+  struct stat st;
+  if (fstat(fd, &st) != 0) {
+    ::close(fd);
+    throw std::runtime_error("stat failed");
+  }
+  size_ = st.st_size;
+  // mmap refuses empty files, those are just done
+  if (size_ > 0) {
+    void* data{mmap(nullptr, size_, PROT_READ, MAP_PRIVATE, fd, 0)};
+    if (data == MAP_FAILED) {
+      ::close(fd);
+      throw std::runtime_error("mmap failed");
+    }
+    data_ = static_cast<const uint8_t*>(data);
+    madvise(data, size_, MADV_SEQUENTIAL);
+  }
+  ::close(fd);
+  read_header();
 }
 
-void TraceIterator::next() {
-  MsgType msg_type{MsgType::Invalid};
-  read_exact(file_, &msg_type, sizeof(uint8_t));
-
-  switch (msg_type) {
-    case MsgType::FunctionId:
-      {
-        uint16_t function_id{0};
-        read_exact(file_, &function_id, sizeof(uint16_t));
-        uint8_t name_len{0};
-        read_exact(file_, &name_len, sizeof(uint8_t));
-        std::vector<uint8_t> name;
-        name.resize(name_len);
-        read_exact(file_, name.data(), name_len);
-
-        std::string name_str{name.begin(), name.end()};
-        function_map_[function_id] = function_id_from_name(name_str);
-
-        next();
-        break;
-      }
-
-    case MsgType::Call:
-      {
-        uint16_t function_id{0};
-        read_exact(file_, &function_id, sizeof(uint16_t));
-        function_id_ = function_map_.at(function_id);
-        read_exact(file_, &item_size_, sizeof(uint64_t));
-        break;
-      }
+TraceIterator::~TraceIterator() {
+  if (data_) {
+    munmap(const_cast<uint8_t*>(data_), size_);
+  }
+}
+
+void* CallStorage::allocate(const uint64_t num_bytes) {
+  if (num_used_ == blocks_.size()) {
+    blocks_.emplace_back();
+  }
+  // Moving the blocks when blocks_ grows keeps their data in place
+  auto& block = blocks_[num_used_++];
+  block.resize((num_bytes + sizeof(uint64_t) - 1) / sizeof(uint64_t));
+  return block.data();
+}
+
+const uint8_t* TraceIterator::read_bytes(const uint64_t num_bytes) {
+  if (num_bytes > size_ - offset_) {
+    throw std::runtime_error("read failed");
+  }
+  const uint8_t* bytes{data_ + offset_};
+  offset_ += num_bytes;
+  return bytes;
+}
+
+void TraceIterator::read_header() {
+  if (size_ < sizeof(kTraceMagic) ||
+      memcmp(data_, kTraceMagic, sizeof(kTraceMagic)) != 0) {
+    // No header, the trace starts with the first message
+    return;
+  }
+  offset_ = sizeof(kTraceMagic);
+  version_ = read<uint16_t>();
+  if (version_ < 1 || version_ > kTraceVersion) {
+    throw std::runtime_error("unsupported trace version");
+  }
+  read<uint8_t>();  // Pointer size
+  const auto platform_len = read<uint8_t>();
+  const char* platform{
+    reinterpret_cast<const char*>(read_bytes(platform_len))};
+  platform_.assign(platform, platform_len);
 
-    default:
-      throw std::runtime_error("invalid message");
+  if (version_ >= 2) {
+    const auto num_functions = read<uint16_t>();
+    for (uint16_t i{0}; i < num_functions; i++) {
+      read_function_id();
+    }
   }
 }
 
-void TraceIterator::skip() {
-  if (fseek(file_, item_size_, SEEK_CUR) != 0) {
-    throw std::runtime_error("seek failed");
+void TraceIterator::read_function_id() {
+  const auto function_id = read<uint16_t>();
+  const auto name_len = read<uint8_t>();
+  const char* name{reinterpret_cast<const char*>(read_bytes(name_len))};
+
+  if (function_id >= function_map_.size()) {
+    function_map_.resize(function_id + 1, FunctionId::Invalid);
+  }
+  function_map_[function_id] =
+      function_id_from_name(std::string(name, name_len));
+}
+
+void TraceIterator::next() {
+  storage_.clear();
+  while (true) {
+    const auto msg_type = static_cast<MsgType>(read<uint8_t>());
+    switch (msg_type) {
+      case MsgType::FunctionId:
+        read_function_id();
+        break;
+
+      case MsgType::Call:
+        function_id_ = function_map_.at(read<uint16_t>());
+        payload_size_ = read<uint64_t>();
+        payload_ = read_bytes(payload_size_);
+        return;
+
+      default:
+        throw std::runtime_error("invalid message");
+    }
   }
 }
 
 bool TraceIterator::done() {
-  return feof(file_);
+  return offset_ >= size_ ||
+      data_[offset_] == static_cast<uint8_t>(MsgType::Footer);
 }
 
 }
@@ -3,8 +3,9 @@
 
 #include <cstdio>
 #include <cstdint>
+#include <cstring>
 #include <fstream>
-#include <map>
+#include <stdexcept>
 #include <string>
 #include <vector>
 
@@ -16,10 +17,26 @@ enum class MsgType : uint8_t {
   Invalid = 0,
   FunctionId = 1,
   Call = 2,
+  Footer = 3,
 };
 
+// A trace starts with the magic, a uint16 version, the size of a
+// pointer and the platform name as a uint8 length and string.
+//
+// From version 2 the header then has a uint16 count and the function
+// table: a (uint16 ID, uint8 length, name) entry for every function
+// the tracer knows, with its FunctionId as ID. Calls use those IDs and
+// no FunctionId messages follow. Version 1 traces declare each ID in
+// a FunctionId message before its first call.
+constexpr char kTraceMagic[4] = {'P', 'T', 'R', 'C'};
+constexpr uint16_t kTraceVersion{2};
+// The file ends with the offset of the footer message and this magic
+constexpr char kFooterMagic[4] = {'P', 'T', 'F', 'T'};
+
 void read_exact(FILE* f, void* dst, uint64_t num_bytes);
 void write_exact(FILE* f, const void* src, uint64_t num_bytes);
+void append_bytes(std::vector<uint8_t>* buf, const void* src,
+                  uint64_t num_bytes);
 
 std::string to_string(const void* ptr);
 
@@ -28,25 +45,103 @@ std::string to_string(const T& t) {
   return std::to_string(t);
 }
 
+// Memory for the arrays of a decoded call that can't point into its
+// payload. Blocks are reused after clear(), so what was allocated is
+// valid until then.
+class CallStorage {
+ public:
+  // Aligned for any array element type
+  void* allocate(uint64_t num_bytes);
+
+  void clear() { num_used_ = 0; }
+
+ private:
+  std::vector<std::vector<uint64_t>> blocks_;
+  size_t num_used_{0};
+};
+
+// Get count elements of an array param at *offset in a call payload
+// of num_bytes, and move *offset past them. The result points into
+// the payload if the elements are aligned there and into a copy in
+// storage if not, nullptr if count is 0. For the generated
+// read_from_buffer()s.
+template<typename T>
+const T* read_array(const uint8_t* payload, const uint64_t num_bytes,
+                    uint64_t* offset, const uint64_t count,
+                    CallStorage* storage) {
+  if (count > (num_bytes - *offset) / sizeof(T)) {
+    throw std::runtime_error("truncated call");
+  }
+  const uint8_t* array{payload + *offset};
+  *offset += count * sizeof(T);
+  if (!count) {
+    return nullptr;
+  }
+  if (reinterpret_cast<uintptr_t>(array) % alignof(T) != 0) {
+    void* copy{storage->allocate(count * sizeof(T))};
+    memcpy(copy, array, count * sizeof(T));
+    return static_cast<const T*>(copy);
+  }
+  return reinterpret_cast<const T*>(array);
+}
+
+// Walks the calls of a trace through a read-only mapping of the file.
+// Payloads aren't copied, payload() points into the mapping and stays
+// valid as long as the iterator. Arrays in it aren't aligned, calls
+// decoded with storage() are only valid until the next call.
 class TraceIterator {
  public:
   explicit TraceIterator(const std::string& path);
+  ~TraceIterator();
 
-  FILE* file() { return file_; }
+  TraceIterator(const TraceIterator&) = delete;
+  TraceIterator& operator=(const TraceIterator&) = delete;
 
   FunctionId function_id() const { return function_id_; }
 
-  void next();
+  // The current call's struct followed by its array data
+  const uint8_t* payload() const { return payload_; }
+  uint64_t payload_size() const { return payload_size_; }
+
+  // For the current call's read_from_buffer(), emptied by next()
+  CallStorage* storage() { return &storage_; }
 
-  void skip();
+  // Format version, 0 for traces written before the header existed
+  uint16_t version() const { return version_; }
+
+  const std::string& platform() const { return platform_; }
+
+  // Move to the next call
+  void next();
 
+  // True at the end of the file or at the footer
   bool done();
 
  private:
-  FILE* file_;
-  std::map<uint16_t, FunctionId> function_map_;
+  void read_header();
+  void read_function_id();
+
+  // Advance past num_bytes and return where they start
+  const uint8_t* read_bytes(uint64_t num_bytes);
+
+  template<typename T>
+  T read() {
+    T value;
+    memcpy(&value, read_bytes(sizeof(value)), sizeof(value));
+    return value;
+  }
+
+  const uint8_t* data_{nullptr};
+  uint64_t size_{0};
+  uint64_t offset_{0};
+  // FunctionId of each ID in the trace
+  std::vector<FunctionId> function_map_;
   FunctionId function_id_{FunctionId::Invalid};
-  uint64_t item_size_{0};
+  const uint8_t* payload_{nullptr};
+  uint64_t payload_size_{0};
+  CallStorage storage_;
+  uint16_t version_{0};
+  std::string platform_;
 };
 
 }
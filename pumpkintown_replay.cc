@@ -75,8 +75,9 @@ Replay::Context::Context(waffle_config* config, Context* share_ctx) {
   }
 }
 
-Replay::Replay(const std::string& path)
-    : iter_{path} {
+Replay::Replay(const std::string& path, FrameStats* stats,
+               GpuTimer* gpu_timer)
+    : iter_{path}, stats_{stats}, gpu_timer_{gpu_timer} {
   int32_t platform = WAFFLE_PLATFORM_GLX;
   int32_t api = WAFFLE_CONTEXT_OPENGL;
   int32_t major = 4;
@@ -136,14 +137,15 @@ Replay::Replay(const std::string& path)
     throw std::runtime_error("waffle_window_create failed");
   }
   default_context_ = new Context(config_);
-  c_ = default_context_;
 
   waffle_window_show(window_);
-  waffle_make_current(display_, window_, default_context_->waffle);
+  make_current(default_context_);
 
   glClearColor(0.4, 0, 0, 1);
   glClear(GL_COLOR_BUFFER_BIT);
-  sleep(1);
+  if (!stats_) {
+    sleep(1);
+  }
   //waffle_window_swap_buffers(window_);
 }
 
@@ -174,16 +176,58 @@ void Replay::capture() {
 }
 
 void Replay::replay() {
+  if (stats_) {
+    stats_->start();
+  }
   while (!iter_.done()) {
     iter_.next();
+    if (stats_) {
+      stats_->add_call();
+    }
     replay_one();
 
-    check_gl_error();
+    if (!stats_) {
+      check_gl_error();
+    }
 
     //capture();
+    call_index_++;
+  }
+  if (stats_) {
+    stats_->finish();
+  }
+  if (gpu_timer_) {
+    // Results can only be read in the context that made the queries
+    Context* current{c_};
+    make_current(default_context_);
+    gpu_timer_->finish();
+    for (const auto& context : contexts_) {
+      make_current(context.second);
+      gpu_timer_->finish();
+    }
+    make_current(current);
   }
 }
 
+void Replay::make_current(Context* context) {
+  c_ = context;
+  waffle_make_current(display_, window_, c_->waffle);
+  if (gpu_timer_) {
+    gpu_timer_->set_context(c_);
+  }
+}
+
+void Replay::swap_buffers() {
+  waffle_window_swap_buffers(window_);
+  if (stats_) {
+    stats_->end_frame();
+  }
+  if (gpu_timer_) {
+    gpu_timer_->poll();
+  }
+  frame_index_++;
+}
+
 void Replay::custom_glXCreateContext(const FnGlXCreateContext& fn) {
   contexts_[fn.return_value] = new Context(config_);
 }
@@ -201,8 +245,7 @@ void Replay::custom_glXMakeContextCurrent(const FnGlXMakeContextCurrent& fn) {
   if (!fn.ctx) {
     waffle_make_current(display_, window_, nullptr);
   } else {
-    c_ = contexts_.at(fn.ctx);
-    waffle_make_current(display_, window_, c_->waffle);
+    make_current(contexts_.at(fn.ctx));
   }
 }
 
@@ -210,8 +253,7 @@ void Replay::custom_glXMakeCurrent(const FnGlXMakeCurrent& fn) {
   if (!fn.ctx) {
     waffle_make_current(display_, window_, nullptr);
   } else {
-    c_ = contexts_.at(fn.ctx);
-    waffle_make_current(display_, window_, c_->waffle);
+    make_current(contexts_.at(fn.ctx));
   }
 }
 
@@ -224,8 +266,7 @@ void Replay::custom_eglMakeCurrent(const FnEglMakeCurrent &fn) {
   if (!fn.ctx) {
     waffle_make_current(display_, window_, nullptr);
   } else {
-    c_ = contexts_.at(fn.ctx);
-    waffle_make_current(display_, window_, c_->waffle);
+    make_current(contexts_.at(fn.ctx));
   }
 }
 
@@ -234,6 +275,11 @@ void Replay::custom_glCreateProgram(const FnGlCreateProgram& fn) {
   c_->r->program_ids[fn.return_value] = new_id;
 }
 
+void Replay::custom_glUseProgram(const FnGlUseProgram& fn) {
+  glUseProgram(fn.program ? c_->r->program_ids.at(fn.program) : 0);
+  c_->program = fn.program;
+}
+
 void Replay::custom_glCreateShader(const FnGlCreateShader& fn) {
   const uint32_t new_id{glCreateShader(fn.type)};
   c_->r->shader_ids[fn.return_value] = new_id;
@@ -412,13 +458,76 @@ void Replay::custom_glLinkProgram(const FnGlLinkProgram& fn) {
 
 }
 
+namespace {
+
+void usage() {
+  fprintf(stderr,
+          "usage: pumpkintown_replay [--benchmark] [--csv PATH] "
+          "[--json PATH] [--gpu-timing PATH] TRACE\n"
+          "\n"
+          "--benchmark  replay without logging and print frame times\n"
+          "--csv PATH   write the time of every frame, implies --benchmark\n"
+          "--json PATH  write the frame time summary and every frame's time,\n"
+          "             implies --benchmark\n"
+          "--gpu-timing PATH\n"
+          "             write the GPU time of every draw call, implies\n"
+          "             --benchmark\n");
+}
+
+}
+
 int main(int argc, char** argv) {
-  if (argc != 2) {
+  bool benchmark{false};
+  std::string csv_path;
+  std::string json_path;
+  std::string gpu_timing_path;
+  std::string trace_path;
+  for (int i{1}; i < argc; i++) {
+    const std::string arg{argv[i]};
+    if (arg == "--benchmark") {
+      benchmark = true;
+    } else if ((arg == "--csv" || arg == "--json") && i + 1 < argc) {
+      (arg == "--csv" ? csv_path : json_path) = argv[++i];
+      benchmark = true;
+    } else if (arg == "--gpu-timing" && i + 1 < argc) {
+      gpu_timing_path = argv[++i];
+      benchmark = true;
+    } else if (trace_path.empty() && arg[0] != '-') {
+      trace_path = arg;
+    } else {
+      usage();
+      return 1;
+    }
+  }
+  if (trace_path.empty()) {
+    usage();
     return 1;
   }
 
-  pumpkintown::Replay replay(argv[1]);
+  pumpkintown::FrameStats stats;
+  pumpkintown::GpuTimer gpu_timer;
+  if (!gpu_timing_path.empty() && !gpu_timer.open(gpu_timing_path)) {
+    fprintf(stderr, "failed to open %s\n", gpu_timing_path.c_str());
+    return 1;
+  }
+  pumpkintown::Replay replay(
+      trace_path, benchmark ? &stats : nullptr,
+      gpu_timing_path.empty() ? nullptr : &gpu_timer);
   replay.replay();
+  // The replay read the results of every context
+  gpu_timer.close();
+
+  if (benchmark) {
+    stats.print_summary(stdout);
+    if (!csv_path.empty() && !stats.write_csv(csv_path)) {
+      fprintf(stderr, "failed to write %s\n", csv_path.c_str());
+      return 1;
+    }
+    if (!json_path.empty() && !stats.write_json(json_path)) {
+      fprintf(stderr, "failed to write %s\n", json_path.c_str());
+      return 1;
+    }
+  }
 
   //waffle_window_swap_buffers(window);
 
@@ -4,7 +4,9 @@
 #include <map>
 #include <vector>
 
+#include "pumpkintown_frame_stats.hh"
 #include "pumpkintown_function_structs.hh"
+#include "pumpkintown_gpu_timer.hh"
 #include "pumpkintown_io.hh"
 
 struct waffle_config;
@@ -16,7 +18,12 @@ namespace pumpkintown {
 
 class Replay {
  public:
-  explicit Replay(const std::string& path);
+  // With stats the replay is a benchmark: nothing is printed per call,
+  // there's no pause at startup or GL error check after every call,
+  // and the time of every frame is recorded in stats. With gpu_timer
+  // every draw call is also timed on the GPU.
+  explicit Replay(const std::string& path, FrameStats* stats=nullptr,
+                  GpuTimer* gpu_timer=nullptr);
 
   void replay();
 
@@ -29,6 +36,7 @@ class Replay {
   void custom_eglMakeCurrent(const FnEglMakeCurrent &fn);
 
   void custom_glCreateProgram(const FnGlCreateProgram& fn);
+  void custom_glUseProgram(const FnGlUseProgram& fn);
   void custom_glCreateShader(const FnGlCreateShader& fn);
   void custom_glAttachShader(const FnGlAttachShader& fn);
   void custom_glDeleteShader(const FnGlDeleteShader& fn);
@@ -62,9 +70,16 @@ class Replay {
  private:
   void replay_one();
 
+  void swap_buffers();
+
   void capture();
 
   TraceIterator iter_;
+  FrameStats* stats_{nullptr};
+  GpuTimer* gpu_timer_{nullptr};
+  // Index of the call being replayed and of its frame
+  uint64_t call_index_{0};
+  uint64_t frame_index_{0};
   waffle_window* window_{nullptr};
   waffle_config* config_{nullptr};
   waffle_display* display_{nullptr};
@@ -87,11 +102,15 @@ class Replay {
 
     waffle_context* waffle{nullptr};
     Resources* r{nullptr};
-    
+    // Program in use as named in the trace, for GpuTimer
+    uint32_t program{0};
   };
   Context* default_context_{nullptr};
   std::map<const void*, Context*> contexts_;
   Context* c_{nullptr};
+
+  // Make context current, c_ follows it
+  void make_current(Context* context);
 };
 
 }
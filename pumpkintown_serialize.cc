@@ -1,13 +1,31 @@
-#include "pumpkintown_gl_util.hh"
 #include "pumpkintown_io.hh"
 #include "pumpkintown_serialize.hh"
 
+#include <cstring>
+#include <new>
+#include <stdexcept>
+
+#include <pthread.h>
+#include <sys/utsname.h>
+
 namespace pumpkintown {
 
+namespace {
+
+// The Serialize the fork handlers act on. Only one is open per
+// process, the one returned by serialize().
+Serialize* open_serialize{nullptr};
+
+}
+
+constexpr uint64_t Serialize::kDirectBytes;
+constexpr uint64_t Serialize::kFlushBytes;
+constexpr uint64_t Serialize::kMaxPendingBytes;
+constexpr uint64_t Serialize::kBufferBytes;
+constexpr std::chrono::milliseconds Serialize::kFlushInterval;
+
 Serialize::~Serialize() {
-  if (file_) {
-    fclose(file_);
-  }
+  close();
 }
 
 bool Serialize::open(const std::string& path) {
@@ -15,51 +33,214 @@ bool Serialize::open(const std::string& path) {
     return false;
   }
   file_ = fopen(path.c_str(), "wb");
-  return file_ != nullptr;
+  if (!file_) {
+    return false;
+  }
+  // Everything is written in large chunks already. Without a stdio
+  // buffer a child forked during a write has none to flush into the
+  // parent's trace at exit.
+  setvbuf(file_, nullptr, _IONBF, 0);
+  pending_.reserve(kBufferBytes);
+  writing_.reserve(kBufferBytes);
+  write_header();
+  flush_thread_ = std::thread(&Serialize::flush_loop, this);
+
+  static std::once_flag fork_handlers;
+  std::call_once(fork_handlers, [] {
+    pthread_atfork(&Serialize::prepare_fork,
+                   &Serialize::after_fork_in_parent,
+                   &Serialize::after_fork_in_child);
+  });
+  open_serialize = this;
+  return true;
 }
 
 bool Serialize::is_open() {
   return file_ != nullptr;
 }
 
-void Serialize::write(const uint8_t* value, uint64_t num_bytes) {
-  return write_exact(file_, value, num_bytes);
+void Serialize::close() {
+  if (!file_) {
+    return;
+  }
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    stopping_ = true;
+  }
+  flush_cond_.notify_one();
+  flush_thread_.join();
+
+  std::lock_guard<std::mutex> lock(mutex_);
+  if (open_serialize == this) {
+    open_serialize = nullptr;
+  }
+  write_footer();
+  write_to_file(pending_);
+  pending_.clear();
+  fclose(file_);
+  file_ = nullptr;
 }
 
-void Serialize::write(const int8_t value) {
-  return write_exact(file_, reinterpret_cast<const uint8_t*>(&value), sizeof(value));
+void Serialize::prepare_fork() {
+  // Otherwise the child could inherit the mutex locked by a thread it
+  // doesn't have
+  if (open_serialize) {
+    open_serialize->mutex_.lock();
+  }
 }
 
-void Serialize::write(const int16_t value) {
-  return write_exact(file_, reinterpret_cast<const uint8_t*>(&value), sizeof(value));
+void Serialize::after_fork_in_parent() {
+  if (open_serialize) {
+    open_serialize->mutex_.unlock();
+  }
 }
 
-void Serialize::write(const int32_t value) {
-  return write_exact(file_, reinterpret_cast<const uint8_t*>(&value), sizeof(value));
+void Serialize::after_fork_in_child() {
+  Serialize* s{open_serialize};
+  if (!s) {
+    return;
+  }
+  // Calls are dropped and close() returns early. The FILE is
+  // unbuffered and left open, so nothing is written on its behalf.
+  s->file_ = nullptr;
+  // The flush thread and any threads waiting on the condition
+  // variables only exist in the parent. Destroying the copies at exit
+  // would terminate on the joinable thread or wait for those waiters
+  // forever, so replace them with fresh ones without destroying them.
+  new (&s->flush_thread_) std::thread;
+  new (&s->flush_cond_) std::condition_variable;
+  new (&s->drained_cond_) std::condition_variable;
+  open_serialize = nullptr;
+  s->mutex_.unlock();
 }
 
-void Serialize::write(const uint8_t value) {
-  return write_exact(file_, reinterpret_cast<const uint8_t*>(&value), sizeof(value));
+void Serialize::append(const void* src, const uint64_t num_bytes) {
+  append_bytes(&pending_, src, num_bytes);
+  offset_ += num_bytes;
 }
 
-void Serialize::write(const uint16_t value) {
-  return write_exact(file_, reinterpret_cast<const uint8_t*>(&value), sizeof(value));
+void Serialize::write_header() {
+  std::string platform;
+  struct utsname name;
+  if (uname(&name) == 0) {
+    platform = std::string(name.sysname) + " " + name.machine;
+  }
+
+  append(kTraceMagic, sizeof(kTraceMagic));
+  append(kTraceVersion);
+  append(static_cast<uint8_t>(sizeof(void*)));
+  append(static_cast<uint8_t>(platform.size()));
+  append(platform.c_str(), platform.size());
+
+  append(kNumFunctions);
+  for (uint16_t id{1}; id <= kNumFunctions; id++) {
+    const char* name{function_name(static_cast<FunctionId>(id))};
+    const uint8_t name_len = strlen(name);
+    append(id);
+    append(name_len);
+    append(name, name_len);
+  }
 }
 
-void Serialize::write(const uint32_t value) {
-  return write_exact(file_, reinterpret_cast<const uint8_t*>(&value), sizeof(value));
+void Serialize::write_call(const FunctionId function, const bool ends_frame) {
+  auto lock = begin_call(function, 0, ends_frame);
+  if (lock) {
+    end_call(&lock, ends_frame);
+  }
 }
 
-void Serialize::write(const uint64_t value) {
-  return write_exact(file_, reinterpret_cast<const uint8_t*>(&value), sizeof(value));
+std::unique_lock<std::mutex> Serialize::begin_call(const FunctionId function,
+                                                   const uint64_t num_bytes,
+                                                   const bool ends_frame) {
+  std::unique_lock<std::mutex> lock(mutex_);
+  if (!file_ || stopping_) {
+    lock.unlock();
+    return lock;
+  }
+  drained_cond_.wait(lock, [this] {
+    return pending_.size() < kMaxPendingBytes;
+  });
+
+  const auto id = static_cast<uint16_t>(function);
+  if (new_frame_) {
+    frame_starts_.push_back(call_offsets_.size());
+    new_frame_ = false;
+  }
+  call_offsets_.push_back(offset_);
+  call_function_ids_.push_back(id);
+  call_sizes_.push_back(num_bytes);
+  new_frame_ = ends_frame;
+
+  append(static_cast<uint8_t>(MsgType::Call));
+  append(id);
+  append(num_bytes);
+  return lock;
 }
 
-void Serialize::write(const float value) {
-  return write_exact(file_, reinterpret_cast<const uint8_t*>(&value), sizeof(value));
+void Serialize::end_call(std::unique_lock<std::mutex>* lock,
+                         const bool ends_frame) {
+  if (ends_frame || pending_.size() >= kFlushBytes) {
+    flush_requested_ = true;
+    lock->unlock();
+    flush_cond_.notify_one();
+  }
 }
 
-void Serialize::write(const double value) {
-  return write_exact(file_, reinterpret_cast<const uint8_t*>(&value), sizeof(value));
+std::vector<uint8_t>& Serialize::thread_buffer() {
+  thread_local std::vector<uint8_t> buffer;
+  buffer.clear();
+  return buffer;
+}
+
+void Serialize::write_footer() {
+  const uint64_t footer_offset{offset_};
+  append(static_cast<uint8_t>(MsgType::Footer));
+  // The function table is in the header
+  append(static_cast<uint64_t>(0));
+  append(static_cast<uint64_t>(call_offsets_.size()));
+  append(static_cast<uint64_t>(frame_starts_.size()));
+  append(call_offsets_.data(), call_offsets_.size() * sizeof(uint64_t));
+  append(call_function_ids_.data(),
+         call_function_ids_.size() * sizeof(uint16_t));
+  append(call_sizes_.data(), call_sizes_.size() * sizeof(uint64_t));
+  append(frame_starts_.data(), frame_starts_.size() * sizeof(uint64_t));
+  append(footer_offset);
+  append(kFooterMagic, sizeof(kFooterMagic));
+}
+
+void Serialize::flush_loop() {
+  std::unique_lock<std::mutex> lock(mutex_);
+  while (!stopping_) {
+    flush_cond_.wait_for(lock, kFlushInterval, [this] {
+      return flush_requested_ || stopping_;
+    });
+    flush_requested_ = false;
+    if (pending_.empty()) {
+      continue;
+    }
+    writing_.swap(pending_);
+    drained_cond_.notify_all();
+
+    lock.unlock();
+    write_to_file(writing_);
+    writing_.clear();
+    if (writing_.capacity() > kBufferBytes) {
+      // Grown by a large payload, don't hold on to it
+      std::vector<uint8_t> reserved;
+      reserved.reserve(kBufferBytes);
+      writing_.swap(reserved);
+    }
+    lock.lock();
+  }
+}
+
+void Serialize::write_to_file(const std::vector<uint8_t>& buf) {
+  try {
+    write_exact(file_, buf.data(), buf.size());
+    fflush(file_);
+  } catch (const std::runtime_error& err) {
+    fprintf(stderr, "failed to write trace: %s\n", err.what());
+  }
 }
 
 }
@@ -1,11 +1,46 @@
 #ifndef PUMPKINTOWN_SERIALIZE_HH_
 #define PUMPKINTOWN_SERIALIZE_HH_
 
+#include <chrono>
+#include <condition_variable>
 #include <cstdint>
+#include <cstdio>
+#include <mutex>
 #include <string>
+#include <thread>
+#include <vector>
+
+#include "pumpkintown_function_id.hh"
 
 namespace pumpkintown {
 
+// Writes a trace file: the header with the function table when
+// opened, then the calls, and on close a footer indexing every call
+// and frame. Calls are written with their FunctionId, see
+// pumpkintown_io.hh. Traces cut short by a crash have no footer and
+// must be read front to back.
+//
+// Calls are encoded by the calling thread into a thread-local buffer
+// and appended to a pending buffer under a short lock, which also
+// fixes their order in the trace. Payloads of kDirectBytes or more
+// are encoded straight into the pending buffer under the lock
+// instead, copying them twice costs more than the lock is held.
+//
+// A background thread writes the pending buffer to the file in large
+// chunks: once it holds kFlushBytes, at the end of every frame and at
+// least every kFlushInterval. The pending buffer and the one being
+// written are swapped rather than reallocated, and callers wait once
+// kMaxPendingBytes are pending. Both have kBufferBytes reserved when
+// the trace is opened, only a payload of about kFlushBytes or more can
+// grow one past that, and the flush thread shrinks it back once it
+// has been written. The thread-local buffers hold less than
+// kDirectBytes.
+//
+// If the traced process forks, the trace stays with the parent. The
+// child has no flush thread, so it records no calls and never touches
+// the file, and closing it in the child does nothing. The parent
+// writes what was pending at the fork. The file is unbuffered so the
+// child doesn't inherit part of a write in a stdio buffer.
 class Serialize {
  public:
   ~Serialize();
@@ -14,28 +49,103 @@ class Serialize {
 
   bool is_open();
 
-  void write(const uint8_t* value, uint64_t num_bytes);
+  // Write everything pending and the footer, then close the file
+  void close();
 
-  // TODO, pick an interface already
-  FILE* file() { return file_; }
+  // Append a call message. fn is one of the function structs, it's
+  // encoded before returning. ends_frame marks calls that swap
+  // buffers.
+  template<typename Fn>
+  void write_call(FunctionId function, const Fn& fn, bool ends_frame);
 
-  void write(int8_t value);
-  void write(int16_t value);
-  void write(int32_t value);
-  void write(int64_t value);
+  // Append a call message without payload
+  void write_call(FunctionId function, bool ends_frame);
 
-  void write(uint8_t value);
-  void write(uint16_t value);
-  void write(uint32_t value);
-  void write(uint64_t value);
+ private:
+  static constexpr uint64_t kDirectBytes{64 * 1024};
+  static constexpr uint64_t kFlushBytes{4 * 1024 * 1024};
+  // Callers wait for the flush thread when this much is pending
+  static constexpr uint64_t kMaxPendingBytes{2 * kFlushBytes};
+  // Reserved for the pending buffer and the one being written: a full
+  // buffer and a payload of up to kFlushBytes
+  static constexpr uint64_t kBufferBytes{kMaxPendingBytes + kFlushBytes};
+  static constexpr std::chrono::milliseconds kFlushInterval{100};
 
-  void write(float value);
-  void write(double value);
+  template<typename T>
+  void append(const T& value) {
+    append(&value, sizeof(value));
+  }
+  void append(const void* src, uint64_t num_bytes);
+
+  // Lock and append the message header, the payload must follow. The
+  // returned lock doesn't hold the mutex if the trace is closed.
+  std::unique_lock<std::mutex> begin_call(FunctionId function,
+                                          uint64_t num_bytes,
+                                          bool ends_frame);
+  void end_call(std::unique_lock<std::mutex>* lock, bool ends_frame);
+
+  // The calling thread's buffer for encoding payloads, emptied
+  static std::vector<uint8_t>& thread_buffer();
+
+  // pthread_atfork handlers for the open Serialize
+  static void prepare_fork();
+  static void after_fork_in_parent();
+  static void after_fork_in_child();
+
+  void write_header();
+  void write_footer();
+  void flush_loop();
+  void write_to_file(const std::vector<uint8_t>& buf);
 
- private:
   FILE* file_{nullptr};
+
+  // Guards everything below
+  std::mutex mutex_;
+  // Wakes the flush thread
+  std::condition_variable flush_cond_;
+  // Wakes callers waiting for the pending buffer to drain
+  std::condition_variable drained_cond_;
+  std::thread flush_thread_;
+  bool flush_requested_{false};
+  bool stopping_{false};
+
+  // Messages not handed to the flush thread yet
+  std::vector<uint8_t> pending_;
+  // Swapped with pending_ by the flush thread, which writes it out
+  // while callers keep appending
+  std::vector<uint8_t> writing_;
+  // Bytes appended so far, the offset of the next message
+  uint64_t offset_{0};
+
+  std::vector<uint64_t> call_offsets_;
+  std::vector<uint16_t> call_function_ids_;
+  std::vector<uint64_t> call_sizes_;
+  std::vector<uint64_t> frame_starts_;
+  bool new_frame_{true};
 };
 
+template<typename Fn>
+void Serialize::write_call(const FunctionId function, const Fn& fn,
+                           const bool ends_frame) {
+  const uint64_t num_bytes{fn.num_bytes()};
+  if (num_bytes < kDirectBytes) {
+    auto& payload = thread_buffer();
+    fn.write_to_buffer(&payload);
+    auto lock = begin_call(function, num_bytes, ends_frame);
+    if (lock) {
+      append(payload.data(), payload.size());
+      end_call(&lock, ends_frame);
+    }
+  } else {
+    auto lock = begin_call(function, num_bytes, ends_frame);
+    if (lock) {
+      fn.write_to_buffer(&pending_);
+      offset_ += num_bytes;
+      end_call(&lock, ends_frame);
+    }
+  }
+}
+
 }
 
 #endif  // PUMPKINTOWN_SERIALIZE_HH_
@@ -1,6 +1,6 @@
 #include "pumpkintown_trace.hh"
 
-#include <map>
+#include <cstdlib>
 #include <set>
 #include <string>
 #include <vector>
@@ -19,24 +19,9 @@
 
 namespace pumpkintown {
 
-void begin_message(const std::string& name) {
-  static std::map<std::string, uint16_t> map;
-  static uint16_t next_id{0};
-  const auto iter = map.find(name);
-  if (iter == map.end()) {
-    const auto id = next_id;
-    next_id++;
-    serialize()->write(static_cast<uint8_t>(MsgType::FunctionId));
-    serialize()->write(static_cast<uint16_t>(id));
-    serialize()->write(static_cast<uint8_t>(name.size()));
-    serialize()->write(reinterpret_cast<const uint8_t*>(name.c_str()),
-                       name.size());
-    map[name] = id;
-    begin_message(name);
-  } else {
-    serialize()->write(static_cast<uint8_t>(MsgType::Call));
-    serialize()->write(static_cast<uint16_t>(map[name]));
-  }
+bool verbose() {
+  static const bool verbose{getenv("PUMPKINTOWN_VERBOSE") != nullptr};
+  return verbose;
 }
 
 void trace_append_glLinkProgram(const GLuint program) {
@@ -91,7 +76,6 @@ static void check_gl_error(const int line) {
 
 // TODO this is copied out of the autogen code
 static void write_glTexImage2D(GLenum target, GLint level, GLint internalformat, GLsizei width, GLsizei height, GLint border, GLenum format, GLenum type, const void * pixels) {
-  begin_message("glTexImage2D");
   pumpkintown::FnGlTexImage2D fn;
   fn.target = target;
   fn.level = level;
@@ -103,9 +87,7 @@ static void write_glTexImage2D(GLenum target, GLint level, GLint internalformat,
   fn.type = type;
   fn.pixels = reinterpret_cast<const uint8_t*>(pixels);
   fn.finalize();
-  pumpkintown::serialize()->write(fn.num_bytes());
-  fn.write_to_file(pumpkintown::serialize()->file());
-  fn.pixels = nullptr;
+  serialize()->write_call(FunctionId::glTexImage2D, fn, false);
 }
 
 void trace_append_glEGLImageTargetTexture2DOES(GLenum target, GLeglImageOES image) {
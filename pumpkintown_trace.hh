@@ -7,7 +7,8 @@
 
 namespace pumpkintown {
 
-void begin_message(const std::string& name);
+// Whether to log every call, set with PUMPKINTOWN_VERBOSE
+bool verbose();
 
 void trace_append_glLinkProgram(GLuint program);
 
@@ -1,7 +1,12 @@
 #include <cassert>
+#include <cerrno>
+#include <cstdlib>
 #include <cstring>
 #include <stdexcept>
 
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 #include <unistd.h>
 
 #include <epoxy/gl.h>
@@ -38,6 +43,46 @@ std::vector<uint8_t> read_all(const std::string& path) {
   return vec;
 }
 
+const uint8_t* packed_blob(const uint64_t index) {
+  // blobs.pack is mapped on first use and stays mapped
+  static const uint8_t* data{nullptr};
+  static uint64_t data_size{0};
+  static std::vector<uint64_t> table;
+
+  if (!data) {
+    const auto vec{read_all("blobs.table")};
+    table.resize(vec.size() / sizeof(uint64_t));
+    memcpy(table.data(), vec.data(), table.size() * sizeof(uint64_t));
+
+    const int fd{open("blobs.pack", O_RDONLY)};
+    if (fd == -1) {
+      fprintf(stderr, "blobs.pack: open failed: %s\n", strerror(errno));
+      exit(1);
+    }
+    struct stat st;
+    if (fstat(fd, &st) == -1) {
+      fprintf(stderr, "blobs.pack: stat failed: %s\n", strerror(errno));
+      exit(1);
+    }
+    data_size = st.st_size;
+    void* addr{mmap(nullptr, data_size, PROT_READ, MAP_PRIVATE, fd, 0)};
+    if (addr == MAP_FAILED) {
+      fprintf(stderr, "blobs.pack: mmap failed: %s\n", strerror(errno));
+      exit(1);
+    }
+    close(fd);
+    data = static_cast<const uint8_t*>(addr);
+  }
+
+  // The table holds (offset, length) pairs
+  const uint64_t offset{table.at(index * 2)};
+  const uint64_t length{table.at(index * 2 + 1)};
+  if (offset + length > data_size) {
+    throw std::runtime_error("packed blob out of bounds");
+  }
+  return data + offset;
+}
+
 void check_program_link(const GLuint program) {
   GLint success = 0;
   glGetProgramiv(program, GL_LINK_STATUS, &success);
@@ -13,6 +13,9 @@ void draw(waffle_display* display, waffle_window* window, waffle_config* config)
 
 std::vector<uint8_t> read_all(const std::string& path);
 
+// Data of blob |index| in the archive written by "explode.py --pack"
+const uint8_t* packed_blob(uint64_t index);
+
 void check_gl_error();
 
 void check_shader_compile(GLuint shader);